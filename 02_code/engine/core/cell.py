@@ -10,13 +10,15 @@ CellSwarm v2 - 细胞 Agent 核心模块
 
 单进程架构，无端口，无分布式依赖。
 """
-import uuid
+import operator
 import random
-import math
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import Optional
 from enum import Enum
 
+from .lineage import NO_PARENT, Lineage
+from .pathways import STATE_OUTPUTS, evaluate_scalar, knockout_factors
+
 
 class CellType(Enum):
     CD8_T = "CD8_T"
@@ -37,24 +39,76 @@ class CyclePhase(Enum):
     SENESCENCE = "senescence"
 
 
+# 细胞感知的环境场及缺省值
+SENSED_FIELDS = (
+    ("oxygen", 0.05),
+    ("glucose", 3.0),
+    ("IFN_gamma", 0.0),
+    ("IL2", 0.0),
+    ("TGF_beta", 0.0),
+    ("PD_L1", 0.0),
+)
+
+def _slotted(cls):
+    """给 dataclass 加上 __slots__（等价于 3.10+ 的 dataclass(slots=True)，兼容 Python 3.9）
+
+    字段缺省值已写进生成的 __init__，重建类时去掉这些类属性，否则与同名 slot 冲突。
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items()
+                 if k not in names and k not in ("__dict__", "__weakref__")}
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+# 短期记忆条数（CellPopulation 的规则经历环形列宽度与之相同）
+SHORT_TERM_SIZE = 5
+
+
+@_slotted
 @dataclass
 class CellMemory:
-    """细胞记忆流 - 参考 Generative Agents"""
-    max_short_term: int = 5
+    """细胞记忆流 - 参考 Generative Agents
+
+    最近 N 轮经历存放在定长环形缓冲区中，每条是一个扁平 tuple
+    (step, decision, outcome, 下标1, 值1, 下标2, 值2, 下标3, 值3)（top-3 通路）；
+    decision 为原决策 dict 的引用（含 params），不复制；
+    文本（signals_summary、get_context）只在读取 short_term 或生成 LLM prompt 时才格式化。
+    """
+    max_short_term: int = SHORT_TERM_SIZE
     max_long_term: int = 20
-    short_term: list = field(default_factory=list)   # 最近N轮
     long_term: list = field(default_factory=list)     # 关键事件
-
-    def add_experience(self, step: int, signals: dict, decision: dict, outcome: str):
-        entry = {
-            "step": step,
-            "signals_summary": self._summarize_signals(signals),
-            "decision": decision,
-            "outcome": outcome
-        }
-        self.short_term.append(entry)
-        if len(self.short_term) > self.max_short_term:
-            self.short_term.pop(0)
+    _ring: list = field(default_factory=list, repr=False)   # 最近N轮（环形）
+    _head: int = field(default=0, repr=False)               # 下一条写入位置
+
+    def add_experience(self, step: int, signals, decision: dict, outcome: str):
+        """记录一轮经历；signals 为 PathwayState 或 {通路: 值} dict"""
+        self.append_entry((step, decision, outcome, *self._top_signals(signals)))
+
+    def append_entry(self, entry: tuple):
+        """追加一条已经是原始格式的记录（CellPopulation 回放批量写入的规则经历时使用）"""
+        if len(self._ring) < self.max_short_term:
+            self._ring.append(entry)
+        else:
+            self._ring[self._head] = entry
+        self._head = (self._head + 1) % self.max_short_term
+
+    def _recent(self, n: int = None) -> list:
+        """按时间顺序返回最近 n 条原始记录"""
+        ring = self._ring
+        if len(ring) == self.max_short_term:
+            ring = ring[self._head:] + ring[:self._head]
+        return ring if n is None else ring[-n:]
+
+    @property
+    def short_term(self) -> list:
+        """最近N轮（按需格式化为 dict）"""
+        return [{"step": step,
+                 "signals_summary": ", ".join(f"{PATHWAY_FIELDS[i]}={v:.2f}"
+                                              for i, v in zip(top[::2], top[1::2])),
+                 "decision": decision,
+                 "outcome": outcome}
+                for step, decision, outcome, *top in self._recent()]
 
     def add_landmark(self, step: int, event: str):
         """记录关键事件（状态剧变）"""
@@ -69,18 +123,35 @@ class CellMemory:
             lines.append("关键经历:")
             for m in self.long_term[-3:]:
                 lines.append(f"  t={m['step']}: {m['event']}")
-        if self.short_term:
+        if self._ring:
             lines.append("最近行动:")
-            for m in self.short_term[-3:]:
-                lines.append(f"  t={m['step']}: {m['decision'].get('action','?')} → {m['outcome']}")
+            for step, decision, outcome, *_ in self._recent(3):
+                lines.append(f"  t={step}: {decision.get('action', '?')} → {outcome}")
         return "\n".join(lines) if lines else "无历史记录（新生细胞）"
 
     @staticmethod
-    def _summarize_signals(signals: dict) -> str:
-        top = sorted(signals.items(), key=lambda x: abs(x[1]), reverse=True)[:3]
-        return ", ".join(f"{k}={v:.2f}" for k, v in top)
-
-
+    def _top_signals(signals) -> tuple:
+        """绝对值最大的 3 条通路 (下标1, 值1, 下标2, 值2, ...)，值保留 3 位小数，同值按通路顺序
+
+        先按原始值排序，只对可能并列的前几名做舍入（舍入单调，结果与先全部舍入再排序一致）。
+        """
+        if isinstance(signals, PathwayState):
+            values = pathway_values(signals)
+        else:
+            values = [signals.get(k, 0.0) for k in PATHWAY_FIELDS]
+        order = sorted(range(len(values)), key=lambda i: abs(values[i]), reverse=True)
+        rounded = {i: round(values[i], 3) for i in order[:3]}
+        cut, k = abs(rounded[order[2]]), 3
+        while k < len(order):
+            rounded[order[k]] = round(values[order[k]], 3)
+            if abs(rounded[order[k]]) != cut:
+                break
+            k += 1
+        top = sorted(sorted(order[:k]), key=lambda i: abs(rounded[i]), reverse=True)[:3]
+        return tuple(x for i in top for x in (i, rounded[i]))
+
+
+@_slotted
 @dataclass
 class PathwayState:
     """信号通路激活状态"""
@@ -100,25 +171,50 @@ class PathwayState:
     caspase: float = 0.0
 
     def to_dict(self) -> dict:
-        return {k: round(v, 3) for k, v in self.__dict__.items()}
+        return {k: round(getattr(self, k), 3) for k in PATHWAY_FIELDS}
 
     def complexity_score(self) -> float:
         """信号复杂度：多条通路同时高激活 = 复杂"""
-        values = list(self.__dict__.values())
+        values = [getattr(self, k) for k in PATHWAY_FIELDS]
         active = sum(1 for v in values if v > 0.4)
-        variance = sum((v - 0.5)**2 for v in values) / len(values)
+        variance = sum((v - 0.5) * (v - 0.5) for v in values) / len(values)
         return min(1.0, active / len(values) + variance)
 
 
+# 通路名称（顺序即 CellPopulation.pathways 矩阵的列顺序）
+PATHWAY_FIELDS = tuple(f.name for f in fields(PathwayState))
+pathway_values = operator.attrgetter(*PATHWAY_FIELDS)
+
+
 class Cell:
-    """单个细胞 Agent"""
+    """单个细胞 Agent
+
+    固定属性布局（__slots__，无逐实例 __dict__），大规模 objects 引擎每个细胞省去 dict 开销；
+    新增状态需同时加入 __slots__。
+
+    lineage 为 None 时细胞使用自己的私有 Lineage（ID 从 0 开始，仅在该谱系内唯一）；
+    需要全局唯一 ID 与完整谱系的调用方应共享同一个 Lineage（模拟中为 Simulation.lineage）。
+    """
+    __slots__ = (
+        "id", "lineage", "cell_type", "position", "alive", "age", "division_count",
+        "energy", "activation", "exhaustion", "proliferation_rate", "immune_evasion",
+        "suppressive_activity", "polarization", "perturbations", "cycle_phase", "cycle_timer",
+        "pathways", "local_env", "memory", "last_decision", "last_llm_step",
+    )
 
     def __init__(self, cell_type: CellType, position: tuple,
                  initial_state: Optional[dict] = None,
-                 perturbations: Optional[dict] = None):
-        self.id = str(uuid.uuid4())[:8]
+                 perturbations: Optional[dict] = None, *,
+                 lineage: Optional[Lineage] = None, parent: int = NO_PARENT):
+        # 顺序整数 ID（由 Lineage 分配，并记录母细胞）
+        if lineage is None:
+            if parent != NO_PARENT:
+                raise ValueError("Cell(parent=...) 需要同时传入分配该母细胞 ID 的 lineage")
+            lineage = Lineage()
+        self.lineage = lineage
+        self.id = lineage.new_id(parent)
         self.cell_type = cell_type
-        self.position = (int(position[0]), int(position[1]))  # (x, y) 网格坐标
+        self.position = tuple(int(c) for c in position)  # (x, y) 网格坐标，3D 为 (x, y, z)
         self.alive = True
         self.age = 0  # 存活步数
         self.division_count = 0
@@ -154,102 +250,40 @@ class Cell:
         self.last_decision = None
         self.last_llm_step = -999
 
-    def sense_environment(self, env_snapshot: dict):
-        """从环境引擎获取局部信号"""
-        x, y = self.position
+    def sense_environment(self, env_snapshot: dict, row: Optional[int] = None):
+        """从环境快照获取局部信号（row 为该细胞在 values 矩阵中的行号）"""
+        if row is None:
+            row = env_snapshot.get("rows", {}).get(self.id)
+        columns = env_snapshot.get("columns", {})
+        values = env_snapshot["values"][row].tolist() if row is not None else []
         self.local_env = {
-            "oxygen": env_snapshot.get("oxygen", {}).get((x, y), 0.05),
-            "glucose": env_snapshot.get("glucose", {}).get((x, y), 3.0),
-            "IFN_gamma": env_snapshot.get("IFN_gamma", {}).get((x, y), 0.0),
-            "IL2": env_snapshot.get("IL2", {}).get((x, y), 0.0),
-            "TGF_beta": env_snapshot.get("TGF_beta", {}).get((x, y), 0.0),
-            "PD_L1": env_snapshot.get("PD_L1", {}).get((x, y), 0.0),
-            "neighbors": env_snapshot.get("neighbors", {}).get((x, y), []),
+            name: values[columns[name]] if values and name in columns else default
+            for name, default in SENSED_FIELDS
         }
+        self.local_env["neighbors"] = env_snapshot.get("neighbors", {}).get(self.position, [])
 
     def compute_pathways(self):
-        """基于局部环境计算通路激活分数（纯代码，不调LLM）"""
+        """基于局部环境计算通路激活分数（纯代码，不调LLM；系数表见 core/pathways.py）"""
         env = self.local_env
-        p = self.pathways
+        inputs = {name: env.get(name, default) for name, default in SENSED_FIELDS}
+        # 检测附近肿瘤细胞 → TCR 信号
+        inputs["tumor_neighbors"] = sum(1 for n in env.get("neighbors", [])
+                                        if n["type"] == "Tumor")
+        for name in ("activation", "exhaustion", "proliferation_rate", "suppressive_activity"):
+            inputs[name] = getattr(self, name)
 
-        if self.cell_type == CellType.CD8_T:
-            # 检测附近肿瘤细胞 → TCR 信号
-            tumor_nearby = sum(1 for n in env.get("neighbors", [])
-                               if n["type"] == "Tumor")
-            p.TCR = _sigmoid(tumor_nearby * 0.5 + self.activation * 0.3)
-            p.CD28 = _sigmoid(env.get("IL2", 0) * 0.8)
-            p.PD1 = _sigmoid(env.get("PD_L1", 0) * 1.2 + self.exhaustion * 0.5)
-            p.CTLA4 = _sigmoid(self.exhaustion * 0.8)
-            p.IL2_JAK_STAT5 = _sigmoid(env.get("IL2", 0) * 1.0)
-            p.IFNg_JAK_STAT1 = _sigmoid(env.get("IFN_gamma", 0) * 0.8)
-            p.TGFb_SMAD = _sigmoid(env.get("TGF_beta", 0) * 1.0)
-
-        elif self.cell_type == CellType.TUMOR:
-            p.PI3K_AKT = _sigmoid(env.get("glucose", 0) * 0.2 + 0.3)
-            p.MAPK_ERK = _sigmoid(self.proliferation_rate * 0.8)
-            p.HIF1a = _sigmoid((0.05 - env.get("oxygen", 0.05)) * 20)
-            p.NFkB = _sigmoid(env.get("IFN_gamma", 0) * 0.5)
-            p.caspase = _sigmoid(
-                env.get("IFN_gamma", 0) * 0.3 - p.PI3K_AKT * 0.5
-            )
-
-        elif self.cell_type == CellType.TREG:
-            p.TGFb_SMAD = _sigmoid(0.5 + self.suppressive_activity * 0.3)
-            p.IL2_JAK_STAT5 = _sigmoid(env.get("IL2", 0) * 1.2)
-
-        elif self.cell_type == CellType.MACROPHAGE:
-            p.NFkB = _sigmoid(env.get("IFN_gamma", 0) * 1.0)
-            p.TGFb_SMAD = _sigmoid(env.get("TGF_beta", 0) * 0.8)
-            # M1 vs M2 极化
-            m1_signal = env.get("IFN_gamma", 0)
-            m2_signal = env.get("TGF_beta", 0) + env.get("IL2", 0) * 0.3
-            self.polarization = _sigmoid(m2_signal - m1_signal)
-
-        # 通用代谢通路
-        p.mTOR = _sigmoid(env.get("glucose", 0) * 0.15 + env.get("oxygen", 0) * 5)
-        p.AMPK = _sigmoid((0.03 - env.get("oxygen", 0.05)) * 15 +
-                          (2.0 - env.get("glucose", 3.0)) * 0.3)
+        p = self.pathways
+        for name, value in evaluate_scalar(self.cell_type.value, inputs).items():
+            setattr(self if name in STATE_OUTPUTS else p, name, value)
 
         # 应用基因敲除扰动
         self._apply_perturbations()
 
     def _apply_perturbations(self):
         """应用基因敲除扰动到通路"""
-        if not self.perturbations:
-            return
-
-        pert_type = self.perturbations.get("type")
-        if pert_type != "knockout":
-            return
-
-        # 检查是否适用于当前细胞类型
-        target_cell_type = self.perturbations.get("cell_type")
-        if target_cell_type and target_cell_type != self.cell_type.value:
-            return
-
-        active_genes = self.perturbations.get("active_genes", [])
         p = self.pathways
-
-        # 基因 → 通路映射
-        gene_pathway_map = {
-            "PDCD1": "PD1",           # PD1_KO → p.PD1 = 0
-            "CTLA4": "CTLA4",         # CTLA4_KO → p.CTLA4 = 0
-            "TGFB1": "TGFb_SMAD",     # TGFB_KO → p.TGFb_SMAD = 0
-            "TGFBR1": "TGFb_SMAD",
-            "TGFBR2": "TGFb_SMAD",
-            "TP53": "caspase",        # TP53_KO → p.caspase 受影响
-            "IFNG": "IFNg_JAK_STAT1", # IFNG_KO → p.IFNg_JAK_STAT1 = 0
-        }
-
-        for gene in active_genes:
-            pathway = gene_pathway_map.get(gene)
-            if pathway and hasattr(p, pathway):
-                if gene == "TP53":
-                    # TP53 KO 降低凋亡敏感性（caspase 减半）
-                    setattr(p, pathway, getattr(p, pathway) * 0.5)
-                else:
-                    # 其他 KO 直接归零
-                    setattr(p, pathway, 0.0)
+        for pathway, factor in knockout_factors(self.perturbations, self.cell_type.value):
+            setattr(p, pathway, getattr(p, pathway) * factor)
 
     def needs_llm(self, call_threshold: float = 0.3) -> bool:
         """判断是否需要调用 LLM（信号复杂时才调）"""
@@ -301,7 +335,7 @@ class Cell:
         # 记录到记忆
         self.memory.add_experience(
             step=step,
-            signals=self.pathways.to_dict(),
+            signals=self.pathways,
             decision=decision,
             outcome=action
         )
@@ -383,7 +417,7 @@ class Cell:
         elif action == "suppress" and self.cell_type == CellType.TREG:
             self.suppressive_activity = min(1.0, self.suppressive_activity + 0.1)
 
-        self.memory.add_experience(step, self.pathways.to_dict(), decision, decision["action"])
+        self.memory.add_experience(step, self.pathways, decision, decision["action"])
         return decision
 
     def apply_random_decision(self, step: int):
@@ -430,7 +464,7 @@ class Cell:
         elif action == "rest":
             self.energy = min(1.0, self.energy + 0.05)
 
-        self.memory.add_experience(step, self.pathways.to_dict(), decision, action)
+        self.memory.add_experience(step, self.pathways, decision, action)
         return decision
 
     def update_lifecycle(self, dt: float) -> Optional[str]:
@@ -481,8 +515,10 @@ class Cell:
 
         return None
 
-    def divide(self) -> 'Cell':
-        """分裂产生子细胞"""
+    def divide(self, lineage: Optional[Lineage] = None) -> 'Cell':
+        """分裂产生子细胞（子细胞 ID 由 lineage 分配，默认为本细胞的 lineage，亲代记为本细胞）"""
+        if lineage is None:
+            lineage = self.lineage
         noise = lambda: random.gauss(0, 0.05)
         child = Cell(
             cell_type=self.cell_type,
@@ -499,7 +535,9 @@ class Cell:
                 "suppressive_activity": self.suppressive_activity,
                 "polarization": self.polarization,
                 "cycle_phase": "G0",
-            }
+            },
+            lineage=lineage,
+            parent=self.id,
         )
         # 母细胞状态更新
         self.energy *= 0.5
@@ -569,7 +607,3 @@ class Cell:
             },
         }
 
-
-def _sigmoid(x: float) -> float:
-    """Sigmoid 函数，输出 [0, 1]"""
-    return 1.0 / (1.0 + math.exp(-max(-20, min(20, x))))
@@ -0,0 +1,137 @@
+"""
+CellSwarm v2 - 向量化战斗结算
+
+与 Simulation._resolve_combat 相同的杀伤模型，对整个 CellPopulation 一次结算：
+- 肿瘤占据栅格 + taxicab 距离变换（带 indices），一次得到每个像素最近的肿瘤像素
+  （2D / 3D 相同，3D 的攻击窗口为立方体）
+- 最近肿瘤超出攻击窗口时才回退到空间索引精确查询
+- 杀伤概率按数组计算
+- 目标冲突规则：同一像素上的攻击者按行号轮流分配该像素上的肿瘤（同样按行号），
+  多个攻击者命中同一肿瘤时由行号最小者击杀；目标被行号更小者击杀的攻击者
+  （无论本轮是否命中）下一轮重新选目标并重新掷骰
+
+只用于 population 引擎；objects 引擎的逐个结算不改动（随机数流与结果保持不变）。
+"""
+from typing import Tuple
+
+import numpy as np
+
+from .cell import CellType
+from .population import ACTION_CODE, CellPopulation, TYPE_CODE
+from .spatial import SpatialIndex, nearest_occupied, occupancy_raster
+
+# 能杀伤肿瘤的类型；Treg suppress 不杀，Tumor evade 不攻击别人
+ATTACKER_TYPES = np.array([TYPE_CODE[t] for t in
+                           (CellType.CD8_T, CellType.NK, CellType.MACROPHAGE)], dtype=np.int8)
+
+BASE_KILL_RATE = 0.3  # 30% base kill rate per attack
+KILL_PROB_RANGE = (0.05, 0.8)
+
+
+def _pixel_groups(keys: np.ndarray, rows: np.ndarray):
+    """按 (像素, 行号) 排序，返回 (排序后的 keys, rows, 每项在组内的序号)"""
+    order = np.lexsort((rows, keys))
+    keys, rows = keys[order], rows[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    first = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    return keys, rows, np.arange(len(keys)) - first
+
+
+def _query_target(spatial: SpatialIndex, tumor_ids: set, pos: tuple, window: int):
+    """空间索引精确查询：窗口内 Manhattan 最近的肿瘤位置，(dx, dy[, dz]) 决定并列"""
+    best = None
+    z = pos[2] if len(pos) > 2 else None
+    for cid in spatial.query(pos[0], pos[1], window, z):
+        if cid in tumor_ids:
+            delta = tuple(t - p for t, p in zip(spatial.position(cid), pos))
+            key = (sum(abs(d) for d in delta),) + delta
+            if best is None or key < best:
+                best = key
+    return None if best is None else tuple(p + d for p, d in zip(pos, best[1:]))
+
+
+def _inside(positions: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    return ((positions >= 0) & (positions < np.array(shape))).all(axis=1)
+
+
+def _assign_targets(pop: CellPopulation, attackers: np.ndarray, tumors: np.ndarray,
+                    spatial: SpatialIndex, shape: Tuple[int, ...], window: int):
+    """为攻击者分配目标肿瘤，返回 (有目标的攻击者行号, 对应肿瘤行号)"""
+    tpos = pop.position[tumors]
+    _, nearest = nearest_occupied(occupancy_raster(tpos, shape))
+
+    # 最近肿瘤像素（窗口内才算数）
+    apos = pop.position[attackers]
+    on_grid = _inside(apos, shape)
+    target = np.full(apos.shape, -1, dtype=np.intp)
+    index = tuple(apos[on_grid].T)
+    for axis in range(len(shape)):
+        target[on_grid, axis] = nearest[axis][index]
+    in_window = on_grid & (np.abs(target - apos).max(axis=1) <= window)
+
+    # 最近目标在窗口外（或攻击者在网格外）：窗口内可能仍有较远目标，逐个精确查询
+    far = np.flatnonzero(~in_window)
+    if len(far):
+        tumor_ids = set(pop.id[tumors].tolist())
+        for i in far:
+            found = _query_target(spatial, tumor_ids, tuple(apos[i].tolist()), window)
+            if found is not None and all(0 <= c < n for c, n in zip(found, shape)):
+                target[i] = found
+                in_window[i] = True
+    attackers, target = attackers[in_window], target[in_window]
+
+    # 冲突规则：像素上第 j 个攻击者 → 该像素第 (j mod m) 个肿瘤
+    t_keys, t_rows, _ = _pixel_groups(np.ravel_multi_index(tuple(tpos.T), shape), tumors)
+    a_keys, attackers, rank = _pixel_groups(np.ravel_multi_index(tuple(target.T), shape),
+                                            attackers)
+    start = np.searchsorted(t_keys, a_keys, side="left")
+    count = np.searchsorted(t_keys, a_keys, side="right") - start
+    # 空间索引与 position 列不同步时，查询到的目标像素上可能没有肿瘤行：丢弃这些攻击者
+    valid = count > 0
+    attackers, start, rank, count = attackers[valid], start[valid], rank[valid], count[valid]
+    return attackers, t_rows[start + rank % count]
+
+
+def resolve_combat(pop: CellPopulation, rows: np.ndarray, rng: np.random.Generator,
+                   spatial: SpatialIndex, shape: Tuple[int, ...],
+                   window: int = 5) -> Tuple[int, np.ndarray]:
+    """结算 rows 中的攻击，返回 (攻击者数, 被杀肿瘤行号)
+
+    按轮结算：每轮所有攻击者同时选目标并掷骰，同一肿瘤只由行号最小的成功者击杀。
+    目标被行号更小的攻击者击杀的攻击者（命中或落空）在逐个结算中本会换目标，
+    因此进入下一轮重新选目标并重新掷骰；行号小于击杀者的落空者已按原目标结算。
+    与逐个结算仍有一处近似：某轮落空后离开的攻击者，不会因为其目标在之后的轮次里
+    被行号更小的攻击者击杀而追溯改选目标。
+    """
+    attackers = rows[pop.action[rows] == ACTION_CODE["attack"]]
+    n_attackers = len(attackers)
+    pending = attackers[np.isin(pop.cell_type[attackers], ATTACKER_TYPES)]
+    tumors = rows[pop.cell_type[rows] == TYPE_CODE[CellType.TUMOR]]
+    tumors = tumors[_inside(pop.position[tumors], shape)]
+
+    killed = []
+    while len(pending) and len(tumors):
+        pending, victims = _assign_targets(pop, pending, tumors, spatial, shape, window)
+        # 杀伤概率 = base_kill_rate * cytotoxicity(activation) * (1 - target.immune_evasion)
+        kill_prob = np.clip(BASE_KILL_RATE * pop.activation[pending]
+                            * (1.0 - pop.immune_evasion[victims]), *KILL_PROB_RANGE)
+        hit = rng.random(len(pending)) < kill_prob
+        # 同一目标：行号最小的成功者击杀（按 (目标, 行号) 排序后每组第一个）
+        h_rows, h_victims = pending[hit], victims[hit]
+        order = np.lexsort((h_rows, h_victims))
+        h_rows, h_victims = h_rows[order], h_victims[order]
+        first = np.ones(len(h_victims), dtype=bool)
+        first[1:] = h_victims[1:] != h_victims[:-1]
+        dead, killer = h_victims[first], h_rows[first]
+        if not len(dead):
+            break
+        killed.append(dead)
+        # 目标被行号更小者击杀的攻击者下一轮重新选目标
+        k = np.minimum(np.searchsorted(dead, victims), len(dead) - 1)
+        retry = (dead[k] == victims) & (pending > killer[k])
+        pending = np.sort(pending[retry])
+        tumors = tumors[~np.isin(tumors, dead)]
+
+    killed = np.concatenate(killed) if killed else np.empty(0, dtype=np.intp)
+    pop.alive[killed] = False
+    return n_attackers, killed
@@ -1,19 +1,47 @@
 """
 CellSwarm v2 - 环境引擎
 
-2D 网格环境，模拟：
-- 氧气/葡萄糖扩散与消耗
-- 信号分子（IFN-γ, IL-2, TGF-β）扩散与降解
+2D 网格环境（grid_size 给出第三个分量时为 3D 体素网格），模拟：
+- 氧气/葡萄糖扩散与消耗（分泌/消耗按类型速率表批量累加，见 secretion.py；
+  可选 solver: steady 每步直接求稳态）
+- 信号分子（IFN-γ, IL-2, TGF-β）扩散与降解（sparse_fields 中的场只更新活跃 tile，见 tiles.py）
 - 细胞邻居检测
 
-使用 NumPy 有限差分法，单进程，无端口。
+场块中的 resolution（µm）可让该场使用更粗的网格，细胞感知/分泌经延拓/限制算子
+与粗场交换数据（见 fieldgrid.py）。
+
+使用 NumPy 有限差分法（显式 / ADI / Crank–Nicolson / 隐式）或 FFT 谱方法（见 diffusion.py），
+单进程，无端口。
 """
+import functools
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from typing import Dict, List, Tuple
 
+from .diffusion import DiffusionSolver, SOLVERS, StencilPass, SteadyStateSolver, make_solver
+from .fieldgrid import FieldGrid
+from .population import CellPopulation, CELL_TYPES
+from .secretion import CellColumns, SecretionStage, rate_tables
+from .spatial import SpatialIndex
+from .tiles import ActiveTiles
+
+_TYPE_NAMES = np.array([t.value for t in CELL_TYPES], dtype=object)
+
+# 血管处的营养场浓度（Dirichlet 值）
+VESSEL_LEVELS = {"oxygen": 0.08, "glucose": 5.0}
+
+# large_tissue 模式下按 KB5 vessels.density 撒布血管（占网格像素的比例）
+VESSEL_DENSITY = {"low": 0.002, "medium": 0.005, "high": 0.01}
+
+# 场的默认存储精度（environment.precision 可覆盖）
+FIELD_PRECISION = {"nutrients": "float64", "signals": "float32"}
+
 
 class Environment:
-    """2D 网格环境引擎"""
+    """2D / 3D 网格环境引擎"""
 
     def __init__(self, config: dict, kb_manager=None):
         env_cfg = config["environment"]
@@ -23,13 +51,21 @@ class Environment:
         if self.kb and self.kb.tme_params:
             ep = self.kb.get_engine_params()
             grid = ep.get("grid", {})
-            gx, gy = grid.get("size", env_cfg["grid_size"])
+            gx, gy = grid.get("size", env_cfg["grid_size"][:2])
             res = grid.get("resolution", env_cfg["resolution"])
+            # large_tissue: 网格尺寸由细胞数决定，KB 的 200 µm 网格只作为下限
+            if env_cfg.get("large_tissue"):
+                gx, gy = max(gx, env_cfg["grid_size"][0]), max(gy, env_cfg["grid_size"][1])
         else:
-            gx, gy = env_cfg["grid_size"]
+            gx, gy = env_cfg["grid_size"][:2]
             res = env_cfg["resolution"]
         self.nx = gx // res
         self.ny = gy // res
+        # 可选第三轴（KB5 只给出 2D 切片尺寸，深度来自配置）
+        self.nz = env_cfg["grid_size"][2] // res if len(env_cfg["grid_size"]) > 2 else 1
+        self.shape: Tuple[int, ...] = ((self.nx, self.ny, self.nz)
+                                       if len(env_cfg["grid_size"]) > 2 else (self.nx, self.ny))
+        self.ndim = len(self.shape)
         self.resolution = res
         self.dt = config["simulation"]["dt"]
 
@@ -41,152 +77,470 @@ class Environment:
         if self.kb and self.kb.tme_params:
             kb_fields = self.kb.get_engine_params().get("fields", {})
 
+        # 多分辨率：场块中的 resolution（µm）须为网格 resolution 的整数倍，默认与细胞网格相同
+        self.grids: Dict[str, FieldGrid] = {}
+        field_cfgs = {"oxygen": env_cfg["oxygen"], "glucose": env_cfg["glucose"],
+                      **env_cfg.get("signals", {})}
+        for name, cfg in field_cfgs.items():
+            field_res = cfg.get("resolution", self.resolution)
+            if field_res % self.resolution:
+                raise ValueError(f"{name}.resolution ({field_res}) must be a multiple of "
+                                 f"the grid resolution ({self.resolution})")
+            self.grids[name] = FieldGrid(self.shape, field_res // self.resolution)
+
+        # 多速率：substeps > 1 时每个细胞步内分 substeps 个子步（分泌量均分到各子步），
+        # update_interval > 1 时每 N 个细胞步才扩散一次（步长 N·dt，分泌仍逐步累加）
+        self._rates: Dict[str, Tuple[int, int]] = {}
+        for name, cfg in field_cfgs.items():
+            substeps, interval = int(cfg.get("substeps", 1)), int(cfg.get("update_interval", 1))
+            if substeps < 1 or interval < 1 or (substeps > 1 and interval > 1):
+                raise ValueError(f"{name}: substeps / update_interval must be >= 1 "
+                                 f"and cannot both be set")
+            if (substeps, interval) != (1, 1):
+                self._rates[name] = (substeps, interval)
+        self._step_count = 0
+        # 每个场的扩散耗时统计：name → [更新次数, 秒]
+        self._cost: Dict[str, List[float]] = {name: [0, 0.0] for name in field_cfgs}
+
         # 氧气场
         o2_cfg = env_cfg["oxygen"]
         o2_kb = kb_fields.get("oxygen", {})
         o2_init = o2_kb.get("initial_level", o2_cfg["vessel_concentration"])
-        self.fields["oxygen"] = np.full((self.nx, self.ny), o2_init)
+        self.fields["oxygen"] = np.full(self.grids["oxygen"].shape, o2_init)
         self._o2_diff = o2_kb.get("diffusion_coeff", o2_cfg["diffusion_coeff"])
         self._o2_decay = o2_kb.get("decay_rate", o2_cfg["decay_rate"])
         self._vessel_pos = [tuple(p) for p in o2_cfg.get("vessel_positions", [])]
+        if env_cfg.get("large_tissue"):
+            self._vessel_pos += self._scatter_vessels(o2_cfg, config["simulation"].get("seed", 42))
+        if self.ndim == 3:
+            # 3D 中 (x, y) 血管贯穿整个深度
+            self._vessel_pos = [p if len(p) == 3 else (p[0], p[1], z)
+                                for p in self._vessel_pos
+                                for z in ([None] if len(p) == 3 else range(self.nz))]
+        inside = [p for p in self._vessel_pos if all(0 <= c < n for c, n in zip(p, self.shape))]
+        vessel_xy = tuple(np.array(inside, dtype=np.intp).reshape(-1, self.ndim).T)
+        self._vessel_index = {name: self.grids[name].restrict_index(vessel_xy)
+                              for name in VESSEL_LEVELS}
 
         # 葡萄糖场
         gluc_cfg = env_cfg["glucose"]
         gluc_kb = kb_fields.get("glucose", {})
         gluc_init = gluc_kb.get("initial_level", gluc_cfg["vessel_concentration"])
-        self.fields["glucose"] = np.full((self.nx, self.ny), gluc_init)
+        self.fields["glucose"] = np.full(self.grids["glucose"].shape, gluc_init)
         self._gluc_diff = gluc_kb.get("diffusion_coeff", gluc_cfg["diffusion_coeff"])
         self._gluc_decay = gluc_kb.get("decay_rate", gluc_cfg["decay_rate"])
 
         # 信号分子场
         self._signal_params = {}
         for name, sig_cfg in env_cfg.get("signals", {}).items():
-            self.fields[name] = np.zeros((self.nx, self.ny))
+            self.fields[name] = np.zeros(self.grids[name].shape)
             self._signal_params[name] = {
                 "diffusion": sig_cfg["diffusion_coeff"],
                 "decay": sig_cfg["decay_rate"],
             }
 
-        # 细胞占位图 (cell_id → position)
-        self._cell_positions: Dict[str, Tuple[int, int]] = {}
-        self._cell_types: Dict[str, str] = {}
+        # 扩散求解器：每个场可单独指定 solver，默认取 environment.diffusion_solver
+        default_solver = env_cfg.get("diffusion_solver", "explicit")
+        self._solver_kind = {
+            "oxygen": o2_cfg.get("solver", default_solver),
+            "glucose": gluc_cfg.get("solver", default_solver),
+        }
+        for name, sig_cfg in env_cfg.get("signals", {}).items():
+            self._solver_kind[name] = sig_cfg.get("solver", default_solver)
+        for name, kind in self._solver_kind.items():
+            # steady: 营养场准稳态求解（需要血管作为 Dirichlet 点）
+            if kind == "steady" and name not in VESSEL_LEVELS:
+                raise ValueError(f"solver: steady is only supported for {list(VESSEL_LEVELS)}, not {name}")
+            if kind not in SOLVERS and kind != "steady":
+                raise ValueError(f"Unknown diffusion solver for {name}: {kind!r}")
+            if kind == "steady" and name in self._rates:
+                raise ValueError(f"{name}: substeps / update_interval do not apply to the steady solver")
+        self._solvers: Dict[str, DiffusionSolver] = {}
+
+        # 场按精度（营养场 / 信号场）与网格粗化倍数分组堆叠为连续张量，
+        # fields 中的数组是它们的视图；粗网格组名为 "<组>@<倍数>"
+        precision = env_cfg.get("precision", {})
+        if isinstance(precision, str):
+            precision = {"nutrients": precision, "signals": precision}
+        order = list(self.fields)
+        groups: Dict[str, List[str]] = {}
+        for name in order:
+            group = "nutrients" if name in VESSEL_LEVELS else "signals"
+            coarsen = self.grids[name].coarsen
+            groups.setdefault(group if coarsen == 1 else f"{group}@{coarsen}", []).append(name)
+        for group in FIELD_PRECISION:
+            dtype = np.dtype(precision.get(group, FIELD_PRECISION[group]))
+            if dtype not in (np.float32, np.float64):
+                raise ValueError(f"precision.{group} must be float32 or float64, got {dtype}")
+        self.field_tensors: Dict[str, np.ndarray] = {}
+        self._group_rows: Dict[str, np.ndarray] = {}
+        views = {}
+        for group, names in groups.items():
+            dtype = np.dtype(precision.get(group.split("@")[0], FIELD_PRECISION[group.split("@")[0]]))
+            tensor = np.stack([self.fields[n] for n in names]).astype(dtype)
+            self.field_tensors[group] = tensor
+            self._group_rows[group] = np.array([order.index(n) for n in names])
+            views.update({n: tensor[i] for i, n in enumerate(names)})
+        self.fields = {name: views[name] for name in order}
+        params = {"oxygen": (self._o2_diff, self._o2_decay),
+                  "glucose": (self._gluc_diff, self._gluc_decay)}
+        params.update({name: (p["diffusion"], p["decay"])
+                       for name, p in self._signal_params.items()})
+        self.field_diffusion = np.array([params[name][0] for name in self.fields], dtype=float)
+        self.field_decay = np.array([params[name][1] for name in self.fields], dtype=float)
+        # 稀疏场：只在活跃 tile 上扩散/降解/钳位（需为显式单步或只降解的场）
+        self._tiles: Dict[str, ActiveTiles] = {}
+        for name in env_cfg.get("sparse_fields", []):
+            if self.ndim != 2:
+                raise ValueError("sparse_fields is only supported on 2D grids")
+            if name not in self.fields:
+                raise ValueError(f"sparse_fields: unknown field {name!r}")
+            if not self.grids[name].is_fine:
+                raise ValueError(f"sparse_fields: {name} must use the cell grid resolution")
+            if name in self._rates:
+                raise ValueError(f"sparse_fields: {name} cannot use substeps / update_interval")
+            i = self.field_names.index(name)
+            if self.field_diffusion[i] > 0 and (
+                    self._solver_kind.get(name) != "explicit"
+                    or make_solver("explicit", self.shape, self.field_diffusion[i] * 1e6,
+                                   self.field_decay[i], self.dt, self.resolution).substeps > 1):
+                raise ValueError(f"sparse_fields: {name} must use a single-step explicit solver")
+            self._tiles[name] = ActiveTiles((self.nx, self.ny), env_cfg.get("tile_size", 16),
+                                            env_cfg.get("sparse_floor", 1e-6))
+            self._tiles[name].mark_nonzero(self.fields[name])
+        # 线程并行：threads > 1 时各场（及大场的行带）在线程池中更新，
+        # NumPy 模板运算释放 GIL；结果与串行逐位一致
+        self.threads = max(1, int(env_cfg.get("threads", 1)))
+        self._pool = ThreadPoolExecutor(max_workers=self.threads) if self.threads > 1 else None
+        self._stencils = self._build_stencils()
+        self._steady: Dict[str, SteadyStateSolver] = {
+            name: SteadyStateSolver(
+                self.grids[name].shape, self.field_diffusion[i] * 1e6, self.field_decay[i],
+                self._field_h(name), list(zip(*(c.tolist() for c in self._vessel_index[name]))),
+                VESSEL_LEVELS[name],
+                method=env_cfg.get("steady_method", "cg"), tol=env_cfg.get("steady_tol", 1e-8))
+            for i, name in enumerate(self.fields) if self._solver_kind.get(name) == "steady"
+        }
+
+        # 分泌/消耗速率表（KB5 场参数覆盖默认值）
+        baseline = self.kb.shared_defaults.get("baseline_consumption") if self.kb else None
+        self.secretion = SecretionStage(rate_tables(kb_fields, baseline))
+
+        # 细胞空间索引 (cell_id → position)，均匀网格分桶
+        self.spatial = SpatialIndex(env_cfg.get("spatial_bin_size", 4))
+
+    def _alive_columns(self, cells):
+        """存活细胞的 (ids, positions (n, d), type names)，支持 Cell 列表或 CellPopulation"""
+        if isinstance(cells, CellPopulation):
+            rows = cells.alive_rows()
+            return (cells.id[rows].tolist(), cells.position[rows],
+                    _TYPE_NAMES[cells.cell_type[rows]].tolist())
+        alive = [c for c in cells if c.alive]
+        positions = np.array([c.position for c in alive], dtype=np.intp).reshape(-1, self.ndim)
+        return [c.id for c in alive], positions, [c.cell_type.value for c in alive]
 
     def register_cells(self, cells):
-        """注册所有细胞的位置"""
-        self._cell_positions.clear()
-        self._cell_types.clear()
-        for cell in cells:
-            if cell.alive:
-                self._cell_positions[cell.id] = cell.position
-                self._cell_types[cell.id] = cell.cell_type.value
+        """注册所有细胞的位置（每步重建空间索引）"""
+        self.spatial.rebuild(*self._alive_columns(cells))
 
     def step(self, cells):
         """推进一个时间步"""
         self.register_cells(cells)
 
         # 1. 扩散 + 降解
-        self._diffuse_field("oxygen", self._o2_diff, self._o2_decay)
-        self._diffuse_field("glucose", self._gluc_diff, self._gluc_decay)
-        for name, params in self._signal_params.items():
-            if params["diffusion"] > 0:
-                self._diffuse_field(name, params["diffusion"], params["decay"])
-            else:
-                # 不扩散的信号（如 PD-L1），只降解
-                self.fields[name] *= (1 - params["decay"] * self.dt)
+        self._diffuse_all()
 
         # 2. 血管补给
-        for vx, vy in self._vessel_pos:
-            if 0 <= vx < self.nx and 0 <= vy < self.ny:
-                self.fields["oxygen"][vx, vy] = 0.08
-                self.fields["glucose"][vx, vy] = 5.0
-
-        # 3. 细胞消耗与分泌
-        for cell in cells:
-            if not cell.alive:
-                continue
-            x, y = cell.position
-            if not (0 <= x < self.nx and 0 <= y < self.ny):
-                continue
+        for name, level in VESSEL_LEVELS.items():
+            self.fields[name][self._vessel_index[name]] = level
+
+        # 3. 细胞消耗与分泌（按速率表批量累加）
+        cols = CellColumns(cells)
+        inside, index = self._grid_index(cols.positions.T)
+        values = self.sample_fields(*cols.positions.T)
+        local = {name: values[:, j] for j, name in enumerate(self.fields)}
+        sources = {}
+        deltas = self.secretion.field_deltas(cols, local)
+        for name, delta in deltas.items():
+            if name in self._steady:
+                sources[name] = delta
+            else:
+                substeps = self._rates.get(name, (1, 1))[0]
+                self.deposit(name, *cols.positions.T[:2], delta / substeps, *cols.positions.T[2:])
+
+        # 3a. 多子步场：剩余子步依次 扩散 → 血管补给 → 分泌（每子步 1/substeps）
+        for name, (substeps, _) in self._rates.items():
+            i = self.field_names.index(name)
+            for _ in range(substeps - 1):
+                np.clip(self.fields[name], 0, None, out=self.fields[name])
+                self._diffuse_task(i, name)()
+                if name in VESSEL_LEVELS:
+                    self.fields[name][self._vessel_index[name]] = VESSEL_LEVELS[name]
+                if name in deltas:
+                    self.deposit(name, *cols.positions.T[:2], deltas[name] / substeps,
+                                 *cols.positions.T[2:])
+
+        # 3b. 准稳态营养场：细胞消耗作为汇项（每步量 / dt），一次求解
+        steady = []
+        for name, solver in self._steady.items():
+            source = np.zeros(self.grids[name].shape)
+            if name in sources:
+                self.grids[name].deposit(source, index, sources[name][inside])
+            steady.append(functools.partial(self._solve_steady, name, source / self.dt))
+        self._run_parallel(steady)
+
+        # 4. 钳位（非负）；稀疏场只处理活跃 tile，并释放已衰减到 floor 以下的 tile
+        self._run_parallel([self._clip_task(name) for name in self.fields])
+        self._step_count += 1
 
-            # 消耗氧气和葡萄糖
-            consumption = 0.002 if cell.cell_type.value == "Tumor" else 0.001
-            self.fields["oxygen"][x, y] = max(0, self.fields["oxygen"][x, y] - consumption)
-            self.fields["glucose"][x, y] = max(0, self.fields["glucose"][x, y] - consumption * 50)
-
-            # 细胞分泌
-            decision = cell.last_decision or {}
-            action = decision.get("action", "")
-
-            if cell.cell_type.value == "CD8_T" and action == "attack":
-                self.fields["IFN_gamma"][x, y] += 0.05
-            elif cell.cell_type.value == "Tumor":
-                self.fields["PD_L1"][x, y] += 0.02 * cell.immune_evasion
-                if cell.pathways.HIF1a > 0.5:
-                    self.fields["TGF_beta"][x, y] += 0.03
-            elif cell.cell_type.value == "Treg":
-                self.fields["TGF_beta"][x, y] += 0.04 * cell.suppressive_activity
-                self.fields["IL2"][x, y] = max(0, self.fields["IL2"][x, y] - 0.02)
-            elif cell.cell_type.value == "Macrophage":
-                if cell.polarization < 0.4:  # M1
-                    self.fields["IFN_gamma"][x, y] += 0.03
-                else:  # M2
-                    self.fields["TGF_beta"][x, y] += 0.02
-
-        # 4. 钳位（非负）
-        for name in self.fields:
-            np.clip(self.fields[name], 0, None, out=self.fields[name])
-
-    def get_local_snapshot(self, x: int, y: int) -> dict:
+    def _clip_task(self, name: str):
+        if name in self._tiles:
+            return lambda: self._tiles[name].clip_and_release(self.fields[name])
+        return lambda: np.clip(self.fields[name], 0, None, out=self.fields[name])
+
+    def _solve_steady(self, name: str, source: np.ndarray):
+        start = time.perf_counter()
+        self._steady[name].solve(self.fields[name], source)
+        self._add_cost(name, start)
+
+    def _run_parallel(self, tasks: list):
+        """执行互不相交的场更新任务：有线程池时并行，否则按顺序"""
+        if self._pool is None:
+            for task in tasks:
+                task()
+            return
+        for future in [self._pool.submit(task) for task in tasks]:
+            future.result()
+
+    def shutdown(self):
+        """关闭场更新线程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _grid_index(self, coords) -> Tuple[np.ndarray, tuple]:
+        """坐标数组 (xs, ys[, zs]) → (是否在网格内, 网格内坐标的索引元组)"""
+        coords = [np.asarray(c, dtype=np.intp) for c in coords]
+        inside = np.ones(coords[0].shape, dtype=bool)
+        for c, n in zip(coords, self.shape):
+            inside &= (c >= 0) & (c < n)
+        return inside, tuple(c[inside] for c in coords)
+
+    def deposit(self, name: str, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray,
+                zs: np.ndarray = None):
+        """把每个细胞的分泌量（负值为消耗）累加到场上，同一像素多次命中会叠加，网格外忽略"""
+        coords = (xs, ys) if zs is None else (xs, ys, zs)
+        inside, index = self._grid_index(coords)
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=float), inside.shape)
+        self.grids[name].deposit(self.fields[name], index, amounts[inside])
+        if name in self._tiles:
+            nonzero = amounts != 0
+            self._tiles[name].mark(np.asarray(xs)[nonzero], np.asarray(ys)[nonzero])
+
+    def get_local_snapshot(self, x: int, y: int, z: int = None) -> dict:
         """获取某个位置的局部环境"""
+        pos = (x, y) if z is None else (x, y, z)
         snapshot = {}
         for name, field in self.fields.items():
-            if 0 <= x < self.nx and 0 <= y < self.ny:
-                snapshot[name] = float(field[x, y])
+            if all(0 <= c < n for c, n in zip(pos, self.shape)):
+                snapshot[name] = float(field[self.grids[name].restrict_index(pos)])
             else:
                 snapshot[name] = 0.0
         return snapshot
 
-    def get_neighbors(self, x: int, y: int, radius: int = 2) -> list:
-        """获取附近的细胞"""
+    def get_neighbors(self, x: int, y: int, radius: int = 2, z: int = None) -> list:
+        """获取附近的细胞（3D 网格需给出 z）"""
+        pos = (x, y) if z is None else (x, y, z)
         neighbors = []
-        for cid, (cx, cy) in self._cell_positions.items():
-            if abs(cx - x) <= radius and abs(cy - y) <= radius:
-                if (cx, cy) != (x, y):
-                    neighbors.append({
-                        "id": cid,
-                        "type": self._cell_types[cid],
-                        "distance": max(abs(cx - x), abs(cy - y)),
-                    })
+        for cid in self.spatial.query(x, y, radius, z):
+            other = self.spatial.position(cid)
+            if other != pos:
+                neighbors.append({
+                    "id": cid,
+                    "type": self.spatial.cell_type(cid),
+                    "distance": max(abs(a - b) for a, b in zip(other, pos)),
+                })
         return neighbors
 
+    @property
+    def field_names(self) -> List[str]:
+        """场名称（即快照矩阵的列顺序）"""
+        return list(self.fields)
+
+    def sample_fields(self, xs: np.ndarray, ys: np.ndarray, zs: np.ndarray = None) -> np.ndarray:
+        """批量采样所有场：返回 (n_cells × n_fields) 矩阵，越界位置为 0"""
+        coords = [np.asarray(c, dtype=np.intp) for c in ((xs, ys) if zs is None else (xs, ys, zs))]
+        inside, _ = self._grid_index(coords)
+        index = tuple(np.where(inside, c, 0) for c in coords)
+        values = np.empty((len(inside), len(self.fields)))
+        for j, (name, field) in enumerate(self.fields.items()):
+            values[:, j] = field[self.grids[name].restrict_index(index)]
+        values[~inside] = 0.0
+        return values
+
+    def count_neighbors(self, cells, cell_type: str, radius: int = 2) -> np.ndarray:
+        """每个存活细胞周围某类型的细胞数（与 get_neighbors 口径一致：
+        Chebyshev 距离 <= radius，且不含同一格上的细胞）
+
+        用占位栅格 + 窗口求和一次算完，结果按存活细胞顺序排列。
+        """
+        _, positions, types = self._alive_columns(cells)
+        inside, index = self._grid_index(positions.T)
+        of_type = np.asarray(types, dtype=object) == cell_type
+
+        occupancy = np.zeros(self.shape, dtype=np.int64)
+        np.add.at(occupancy, tuple(c[of_type[inside]] for c in index), 1)
+        window = _box_sum(occupancy, radius)
+
+        counts = np.zeros(len(positions), dtype=np.int64)
+        counts[inside] = window[index] - occupancy[index]
+        # 网格外的细胞（罕见）回退到空间索引
+        for i in np.flatnonzero(~inside):
+            x, y, *z = positions[i].tolist()
+            counts[i] = sum(1 for n in self.get_neighbors(x, y, radius, *z)
+                            if n["type"] == cell_type)
+        return counts
+
     def build_cell_env_snapshot(self, cells) -> dict:
-        """为所有细胞构建环境快照（供 cell.sense_environment 使用）"""
-        snapshot = {name: {} for name in self.fields}
-        snapshot["neighbors"] = {}
+        """为所有存活细胞构建环境快照（供 cell.sense_environment 使用）
+
+        values[i, j] 为第 i 个存活细胞（按 cells 顺序）处第 j 个场的值，
+        列顺序见 columns；rows 把 cell_id 映射到行号；
+        neighbors 按位置在首次访问时才查询空间索引。
+        """
+        ids, positions, _ = self._alive_columns(cells)
+        return {
+            "columns": {name: j for j, name in enumerate(self.fields)},
+            "values": self.sample_fields(*positions.T),
+            "rows": dict(zip(ids, range(len(ids)))),
+            "neighbors": NeighborMap(self),
+        }
 
-        for cell in cells:
-            if not cell.alive:
+    def _scatter_vessels(self, o2_cfg: dict, seed: int) -> List[Tuple[int, ...]]:
+        """大组织按密度随机撒布血管（oxygen.vessel_density 或 KB5 vessels.density）"""
+        density = o2_cfg.get("vessel_density")
+        if density is None and self.kb and self.kb.tme_params:
+            density = self.kb.get_engine_params().get("vessels", {}).get("density")
+        density = VESSEL_DENSITY.get(density, density) if density is not None else VESSEL_DENSITY["medium"]
+        size = int(np.prod(self.shape))
+        n = int(round(float(density) * size))
+        rng = np.random.default_rng(seed)
+        flat = rng.choice(size, size=min(n, size), replace=False)
+        return list(zip(*(a.tolist() for a in np.unravel_index(flat, self.shape))))
+
+    def _build_stencils(self) -> Dict[str, StencilPass]:
+        """每组张量一次模板更新：可用显式单步求解的场系数非 0，其余场由各自求解器处理"""
+        scaled = self.field_diffusion * 1e6  # 调整量纲
+        self._batched = np.zeros(len(self.fields), dtype=bool)
+        for i, name in enumerate(self.fields):
+            if name in self._tiles or name in self._rates:
                 continue
-            x, y = cell.position
-            for name in self.fields:
-                snapshot[name][(x, y)] = self.get_local_snapshot(x, y).get(name, 0)
-            snapshot["neighbors"][(x, y)] = self.get_neighbors(x, y)
+            if self.field_diffusion[i] > 0 and self._solver_kind.get(name) == "explicit":
+                probe = make_solver("explicit", self.grids[name].shape, scaled[i],
+                                    self.field_decay[i], self.dt, self._field_h(name))
+                self._batched[i] = probe.substeps == 1
+        diff = np.where(self._batched, scaled, 0.0)
+        decay = np.where(self._batched, self.field_decay, 0.0)
+        names = self.field_names
+        return {group: StencilPass(tensor.shape, diff[self._group_rows[group]],
+                                   decay[self._group_rows[group]], self.dt,
+                                   self._field_h(names[self._group_rows[group][0]]),
+                                   dtype=tensor.dtype, bands=self.threads)
+                for group, tensor in self.field_tensors.items()}
 
-        return snapshot
+    def _field_dt(self, name: str) -> float:
+        """场的扩散步长：dt × update_interval / substeps"""
+        substeps, interval = self._rates.get(name, (1, 1))
+        return self.dt * interval / substeps
 
-    def _diffuse_field(self, name: str, diff_coeff: float, decay_rate: float):
-        """有限差分法扩散"""
-        field = self.fields[name]
-        # 拉普拉斯算子（5点模板）
-        laplacian = (
-            np.roll(field, 1, axis=0) + np.roll(field, -1, axis=0) +
-            np.roll(field, 1, axis=1) + np.roll(field, -1, axis=1) -
-            4 * field
-        ) / (self.resolution ** 2)
+    def _field_h(self, name: str) -> float:
+        """场网格间距（µm）：粗网格场为 resolution × 粗化倍数"""
+        return self.resolution * self.grids[name].coarsen
+
+    def _diffuse_all(self):
+        """所有场一次模板更新，其余场（隐式 / 需子步 / 不扩散）逐个处理
+
+        有线程池时，逐场求解器先作为独立任务提交，模板更新在当前线程按行带分发到
+        同一线程池；两者写入的场互不相交。
+        """
+        tasks = [self._diffuse_task(i, name) for i, name in enumerate(self.fields)
+                 if not (self._batched[i] or name in self._steady)
+                 and self._step_count % self._rates.get(name, (1, 1))[1] == 0]
+        futures = [self._pool.submit(task) for task in tasks] if self._pool else []
+        for group, stencil in self._stencils.items():
+            start = time.perf_counter()
+            stencil.step(self.field_tensors[group], self._pool)
+            # 组内各活跃场的模板运算量相同，耗时均分
+            rows = self._group_rows[group][stencil.active]
+            for i in rows:
+                self._add_cost(self.field_names[i], start, len(rows))
+        if self._pool is None:
+            self._run_parallel(tasks)
+        for future in futures:
+            future.result()
+
+    def _diffuse_task(self, i: int, name: str):
+        def task():
+            start = time.perf_counter()
+            if name in self._tiles:
+                self._tiles[name].diffuse(self.fields[name], self.field_diffusion[i] * 1e6,
+                                          self.field_decay[i], self.dt, self.resolution)
+            elif self.field_diffusion[i] > 0:
+                self._diffuse_field(name, self.field_diffusion[i], self.field_decay[i])
+            else:
+                # 不扩散的信号（如 PD-L1），只降解
+                self.fields[name] *= (1 - self.field_decay[i] * self._field_dt(name))
+            self._add_cost(name, start)
+        return task
+
+    def _add_cost(self, name: str, start: float, share: int = 1):
+        cost = self._cost[name]
+        cost[0] += 1
+        cost[1] += (time.perf_counter() - start) / share
 
+    def cost_report(self) -> Dict[str, dict]:
+        """各场扩散耗时 {name: {substeps, update_interval, updates, seconds, ms_per_step}}
+
+        updates 为实际扩散次数（含子步），ms_per_step 按已推进的细胞步数平均；
+        准稳态场的求解计入 seconds，batched 模板组的耗时在组内活跃场之间均分。
+        """
+        steps = max(1, self._step_count)
+        report = {}
+        for name, (updates, seconds) in self._cost.items():
+            substeps, interval = self._rates.get(name, (1, 1))
+            report[name] = {"substeps": substeps, "update_interval": interval,
+                            "updates": int(updates), "seconds": round(seconds, 4),
+                            "ms_per_step": round(1e3 * seconds / steps, 3)}
+        return report
+
+    def _diffuse_field(self, name: str, diff_coeff: float, decay_rate: float):
+        """扩散 + 降解（求解器按场缓存，参数变化时重建）"""
         # 缩放扩散系数到合理范围
-        scaled_diff = diff_coeff * 1e6  # 调整量纲
-        field += self.dt * (scaled_diff * laplacian - decay_rate * field)
+        self._solver_for(name, diff_coeff * 1e6, decay_rate).step(self.fields[name])
+
+    def _solver_for(self, name: str, scaled_diff: float, decay_rate: float) -> DiffusionSolver:
+        solver = self._solvers.get(name)
+        if solver is None or (solver.diff, solver.decay) != (scaled_diff, decay_rate):
+            solver = make_solver(self._solver_kind.get(name, "explicit"), self.grids[name].shape,
+                                 scaled_diff, decay_rate, self._field_dt(name), self._field_h(name))
+            self._solvers[name] = solver
+        return solver
+
+    def memory_report(self) -> Dict[str, int]:
+        """各场与求解器缓冲区占用的字节数 {"field:<名>" / "scratch:<类别>:<名>": bytes}"""
+        report = {f"field:{name}": field.nbytes for name, field in self.fields.items()}
+        for group, stencil in self._stencils.items():
+            report[f"scratch:stencil:{group}"] = stencil.nbytes
+        for i, name in enumerate(self.fields):
+            if name in self._steady:
+                report[f"scratch:steady:{name}"] = self._steady[name].nbytes
+            elif name in self._tiles:
+                report[f"scratch:tiles:{name}"] = self._tiles[name].nbytes
+            elif not self._batched[i] and self.field_diffusion[i] > 0:
+                # 求解器首次扩散时才构造，这里提前构造（之后直接复用）
+                solver = self._solver_for(name, self.field_diffusion[i] * 1e6, self.field_decay[i])
+                report[f"scratch:solver:{name}"] = solver.nbytes
+        return report
 
     def field_stats(self) -> dict:
         """返回各场的统计信息"""
@@ -200,6 +554,49 @@ class Environment:
             }
         return stats
 
-    def field_snapshot(self) -> dict:
-        """返回所有场的完整 2D 数据（用于 snapshot 存储）"""
-        return {name: field.tolist() for name, field in self.fields.items()}
+    def field_snapshot(self, stride: int = 1) -> dict:
+        """返回所有场的 2D 数据（用于 snapshot 存储），stride > 1 时每隔 stride 格取一个点
+
+        粗网格场先延拓回细胞网格，快照中所有场形状一致。
+
+        tolist 会为每个像素生成一个 Python float（约 24 B + 列表指针 8 B），
+        大网格的快照内存远大于场本身；float32 场先转 float64 并保留 8 位小数，
+        避免 JSON 中出现 0.10000000149011612 这类二进制舍入尾数。
+        """
+        fields = {name: self.grids[name].prolong(field)[(slice(None, None, stride),) * field.ndim]
+                  for name, field in self.fields.items()}
+        return {name: (field.tolist() if field.dtype == np.float64
+                       else field.astype(np.float64).round(8).tolist())
+                for name, field in fields.items()}
+
+
+class NeighborMap:
+    """按需计算的邻居表 (x, y[, z]) → neighbors，首次访问某位置时查询空间索引"""
+
+    def __init__(self, env: Environment, radius: int = 2):
+        self._env = env
+        self._radius = radius
+        self._cache: Dict[Tuple[int, ...], list] = {}
+
+    def get(self, position: tuple, default=None) -> list:
+        key = tuple(int(c) for c in position)
+        if key not in self._cache:
+            x, y, *z = key
+            self._cache[key] = self._env.get_neighbors(x, y, self._radius, *z)
+        return self._cache[key]
+
+    def __getitem__(self, position: tuple) -> list:
+        return self.get(position)
+
+
+def _box_sum(grid: np.ndarray, radius: int) -> np.ndarray:
+    """(2r+1)^d 窗口求和（网格外视为 0），积分图 + 容斥实现，d = 2 / 3"""
+    w = 2 * radius + 1
+    integral = np.pad(np.pad(grid, radius), [(1, 0)] * grid.ndim)
+    for axis in range(grid.ndim):
+        integral = integral.cumsum(axis)
+    total = 0
+    for corner in itertools.product((0, 1), repeat=grid.ndim):
+        index = tuple(slice(None, -w) if c else slice(w, None) for c in corner)
+        total = total + (-1) ** sum(corner) * integral[index]
+    return total
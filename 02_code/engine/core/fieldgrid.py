@@ -0,0 +1,56 @@
+"""
+CellSwarm v2 - 多分辨率场网格
+
+每个场可以存放在比细胞网格更粗的网格上（coarsen = 场分辨率 / 细胞网格分辨率，整数）：
+氧气/葡萄糖的特征长度远大于一个细胞，粗网格即可；IFN-γ / IL-2 等局部信号保持细网格。
+
+细胞与场之间通过两个算子交换数据：
+- 延拓 (prolongation): 细胞感知所在粗格的值（分片常数注入），快照时把粗场展开回细网格
+- 限制 (restriction): 细胞的分泌/消耗量累加到所在粗格，并除以粗格覆盖的细格数，
+  保持总量守恒（粗格浓度 = 覆盖的细格浓度的平均）
+
+网格边长不能整除时，末尾的粗格只覆盖剩余的细格，体积按实际覆盖数计算。
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+class FieldGrid:
+    """细胞网格 shape 与某个场的粗网格之间的映射"""
+
+    def __init__(self, shape: Tuple[int, ...], coarsen: int = 1):
+        self.fine_shape = tuple(shape)
+        self.coarsen = f = max(1, int(coarsen))
+        self.shape = tuple(-(-n // f) for n in self.fine_shape)
+        # 每个粗格覆盖的细格数（各轴覆盖长度之积）
+        self.volume = np.ones(self.shape)
+        for axis, n in enumerate(self.fine_shape):
+            cover = np.minimum(f, n - np.arange(self.shape[axis]) * f).astype(float)
+            self.volume = self.volume * cover.reshape((-1,) + (1,) * (len(shape) - axis - 1))
+
+    @property
+    def is_fine(self) -> bool:
+        return self.coarsen == 1
+
+    def restrict_index(self, index: tuple) -> tuple:
+        """细网格坐标（网格内）→ 粗网格坐标"""
+        if self.is_fine:
+            return index
+        return tuple(c // self.coarsen for c in index)
+
+    def deposit(self, field: np.ndarray, index: tuple, amounts: np.ndarray):
+        """限制：把细网格上的浓度增量累加到粗场（按覆盖体积折算）"""
+        if self.is_fine:
+            np.add.at(field, index, amounts)
+            return
+        coarse = self.restrict_index(index)
+        np.add.at(field, coarse, amounts / self.volume[coarse])
+
+    def prolong(self, field: np.ndarray) -> np.ndarray:
+        """延拓：粗场展开为细网格上的分片常数场（细网格场原样返回）"""
+        if self.is_fine:
+            return field
+        for axis in range(field.ndim):
+            field = np.repeat(field, self.coarsen, axis=axis)
+        return field[tuple(slice(0, n) for n in self.fine_shape)]
@@ -0,0 +1,115 @@
+"""
+CellSwarm v2 - 向量化生命周期
+
+与 Cell.update_lifecycle / Cell.divide 相同的规则，对整个 CellPopulation 批量执行：
+- advance_lifecycle: 一次推进所有细胞的 G1/S/G2/M 计时器，返回分裂、死亡与衰老的行号
+- divide: 按行号批量分裂，子细胞作为新行一次性追加（向量化噪声）
+
+凋亡、分裂、耗竭衰老和子细胞继承记忆的关键事件（CellMemory landmark）与 Cell 一致，
+只对发生事件的行逐个写入。
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from .cell import CellType, CyclePhase
+from .lineage import Lineage
+from .population import CellPopulation, CellView, PHASE_CODE, TYPE_CODE
+
+# 细胞周期: 当前相 → (持续时间/小时, 下一相)
+CYCLE_SCHEDULE = (
+    (CyclePhase.G1, 8, CyclePhase.S),
+    (CyclePhase.S, 6, CyclePhase.G2),
+    (CyclePhase.G2, 4, CyclePhase.M),
+    (CyclePhase.M, 1, CyclePhase.G0),
+)
+
+
+def _add_landmarks(pop: CellPopulation, rows: np.ndarray, events: List[str],
+                   steps: Sequence[int]):
+    """逐行写入关键事件（只对发生事件的行创建/读取 CellMemory）"""
+    for row, step, event in zip(rows.tolist(), steps, events):
+        CellView(pop, row).memory.add_landmark(step, event)
+
+
+def advance_lifecycle(pop: CellPopulation, rows: np.ndarray,
+                      dt: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """推进 rows 的生命周期，返回 (完成分裂的行号, 能量耗尽死亡的行号, 耗竭衰老的行号)"""
+    pop.age[rows] += 1
+    pop.energy[rows] -= 0.01 * dt  # 基础代谢消耗
+
+    # 能量耗尽 → 凋亡
+    starved = pop.energy[rows] <= 0
+    died = rows[starved]
+    pop.alive[died] = False
+    pop.cycle_phase[died] = PHASE_CODE[CyclePhase.APOPTOSIS]
+    _add_landmarks(pop, died, ["能量耗尽，凋亡"] * len(died), pop.age[died].tolist())
+
+    # 细胞周期推进（每步最多跨一个相，按推进前的相判断）
+    live = rows[~starved]
+    phase = pop.cycle_phase[live]
+    divided = np.zeros(len(live), dtype=bool)
+    for current, duration, nxt in CYCLE_SCHEDULE:
+        sel = phase == PHASE_CODE[current]
+        r = live[sel]
+        pop.cycle_timer[r] += dt
+        done = pop.cycle_timer[r] >= duration
+        pop.cycle_phase[r[done]] = PHASE_CODE[nxt]
+        pop.cycle_timer[r[done]] = 0
+        if current == CyclePhase.M:
+            divided[np.flatnonzero(sel)[done]] = True
+    divided_rows = live[divided]
+    pop.division_count[divided_rows] += 1
+    _add_landmarks(pop, divided_rows,
+                   [f"完成第{n}次分裂" for n in pop.division_count[divided_rows].tolist()],
+                   pop.age[divided_rows].tolist())
+
+    # T 细胞耗竭（本步未分裂者）
+    r = live[~divided]
+    r = r[(pop.cell_type[r] == TYPE_CODE[CellType.CD8_T]) & (pop.exhaustion[r] > 0.8)]
+    pop.cycle_phase[r] = PHASE_CODE[CyclePhase.SENESCENCE]
+    _add_landmarks(pop, r, ["严重耗竭，进入衰老"] * len(r), pop.age[r].tolist())
+
+    return divided_rows, died, r
+
+
+def divide(pop: CellPopulation, parents: np.ndarray, rng: np.random.Generator,
+           bounds: Tuple[int, ...], lineage: Lineage) -> np.ndarray:
+    """批量分裂：每个母细胞产生一个子细胞，一次追加为新行，返回子细胞行号
+
+    子细胞 ID 由 lineage 连续分配，并记录母细胞 ID。
+    """
+    n = len(parents)
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    children = pop.new_rows(n)
+    children["id"][:] = lineage.new_ids(n, pop.id[parents])
+    for name in ("cell_type", "proliferation_rate", "immune_evasion",
+                 "suppressive_activity", "polarization"):
+        children[name][:] = getattr(pop, name)[parents]
+
+    # 位置：母细胞周围 ±1 格，限制在网格内
+    offset = rng.integers(-1, 2, size=(n, len(bounds)))
+    children["position"][:] = np.clip(pop.position[parents] + offset, 0,
+                                      np.array(bounds) - 1)
+
+    noise = rng.normal(0, 0.05, size=(n, 2))
+    children["energy"][:] = np.maximum(0.3, pop.energy[parents] * 0.5 + noise[:, 0])
+    children["activation"][:] = np.maximum(0, pop.activation[parents] * 0.8 + noise[:, 1])
+    children["exhaustion"][:] = np.maximum(0, pop.exhaustion[parents] * 0.5)
+    # 随机延迟避免同步分裂
+    children["cycle_timer"][:] = rng.uniform(0, 3, size=n)
+
+    # 母细胞状态更新
+    pop.energy[parents] *= 0.5
+    pop.cycle_phase[parents] = PHASE_CODE[CyclePhase.G0]
+    rows = pop.append_rows(children)
+
+    # 子细胞继承压缩记忆（母细胞有关键事件时）
+    inherit = np.array([m is not None and bool(m.long_term) for m in pop.memory[parents]],
+                       dtype=bool)
+    heirs = rows[inherit]
+    _add_landmarks(pop, heirs,
+                   [f"继承自 {cid} 的记忆" for cid in pop.id[parents[inherit]].tolist()],
+                   [0] * len(heirs))
+    return rows
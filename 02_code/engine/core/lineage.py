@@ -0,0 +1,79 @@
+"""
+CellSwarm v2 - 细胞 ID 与克隆谱系
+
+每次模拟一个 Lineage：细胞 ID 为从 0 开始单调递增的整数，ID 同时是 parent 数组的下标，
+parent[id] 为母细胞 ID（初始细胞为 NO_PARENT）。分裂时由 divide() 写入，
+不需要额外的逐细胞对象即可还原完整的克隆谱系树。
+"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+NO_PARENT = -1
+
+
+class Lineage:
+    """顺序整数 ID 分配器 + 亲代表（容量按倍增扩展）"""
+
+    def __init__(self, capacity: int = 1024):
+        self._parent = np.full(max(1, capacity), NO_PARENT, dtype=np.int64)
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def parent(self) -> np.ndarray:
+        """parent[id] → 母细胞 ID（只读视图）"""
+        view = self._parent[:self._n]
+        view.flags.writeable = False
+        return view
+
+    def _reserve(self, n: int):
+        if self._n + n > len(self._parent):
+            grown = np.full(max(2 * len(self._parent), self._n + n), NO_PARENT, dtype=np.int64)
+            grown[:self._n] = self._parent[:self._n]
+            self._parent = grown
+
+    def new_id(self, parent: int = NO_PARENT) -> int:
+        """分配一个 ID（objects 引擎逐个创建细胞时使用）"""
+        self._reserve(1)
+        cid = self._n
+        self._parent[cid] = parent
+        self._n += 1
+        return cid
+
+    def new_ids(self, n: int, parents: Optional[Sequence[int]] = None) -> np.ndarray:
+        """批量分配 n 个连续 ID，parents 为各自的母细胞 ID"""
+        self._reserve(n)
+        ids = np.arange(self._n, self._n + n, dtype=np.int64)
+        if parents is not None:
+            self._parent[ids] = parents
+        self._n += n
+        return ids
+
+    def children(self, cid: int) -> np.ndarray:
+        return np.flatnonzero(self.parent == cid)
+
+    def ancestors(self, cid: int) -> List[int]:
+        """从母细胞到初始细胞的祖先链"""
+        chain = []
+        cid = int(self._parent[cid])
+        while cid != NO_PARENT:
+            chain.append(cid)
+            cid = int(self._parent[cid])
+        return chain
+
+    def founders(self, ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        """每个细胞所属克隆的初始细胞 ID（指针跳跃，O(n log 深度)）"""
+        parent = self.parent
+        root = np.where(parent == NO_PARENT, np.arange(self._n), parent)
+        while True:
+            jumped = root[root]
+            if np.array_equal(jumped, root):
+                break
+            root = jumped
+        return root if ids is None else root[np.asarray(ids, dtype=np.intp)]
+
+    def to_dict(self) -> dict:
+        return {"parent": self.parent.tolist()}
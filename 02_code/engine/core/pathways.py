@@ -0,0 +1,154 @@
+"""
+CellSwarm v2 - 通路模型（系数表）
+
+每条通路的激活分数 = sigmoid(bias + Σ coef × input)，
+系数按细胞类型写成表格，输入为局部环境、细胞状态或同表中先算出的通路。
+
+同一份表格有两种求值方式：
+- evaluate_scalar: 单个 Cell 逐项求值（Cell.compute_pathways）
+- PATHWAY_STAGES: 编译成按依赖分层的系数矩阵，CellPopulation 对同类型细胞
+  做一次批量仿射变换 + sigmoid
+"""
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# 表格可引用的输入特征（通路名称之外）
+FEATURES = (
+    "oxygen", "glucose", "IFN_gamma", "IL2", "TGF_beta", "PD_L1",
+    "tumor_neighbors",
+    "activation", "exhaustion", "proliferation_rate", "suppressive_activity",
+)
+
+# 细胞类型 → {输出: (bias, {输入: 系数})}，按求值顺序排列
+PATHWAY_MODEL: Dict[str, Dict[str, Tuple[float, Dict[str, float]]]] = {
+    "CD8_T": {
+        # 检测附近肿瘤细胞 → TCR 信号
+        "TCR": (0.0, {"tumor_neighbors": 0.5, "activation": 0.3}),
+        "CD28": (0.0, {"IL2": 0.8}),
+        "PD1": (0.0, {"PD_L1": 1.2, "exhaustion": 0.5}),
+        "CTLA4": (0.0, {"exhaustion": 0.8}),
+        "IL2_JAK_STAT5": (0.0, {"IL2": 1.0}),
+        "IFNg_JAK_STAT1": (0.0, {"IFN_gamma": 0.8}),
+        "TGFb_SMAD": (0.0, {"TGF_beta": 1.0}),
+    },
+    "Tumor": {
+        "PI3K_AKT": (0.3, {"glucose": 0.2}),
+        "MAPK_ERK": (0.0, {"proliferation_rate": 0.8}),
+        # (0.05 - O2) × 20
+        "HIF1a": (1.0, {"oxygen": -20.0}),
+        "NFkB": (0.0, {"IFN_gamma": 0.5}),
+        "caspase": (0.0, {"IFN_gamma": 0.3, "PI3K_AKT": -0.5}),
+    },
+    "Treg": {
+        "TGFb_SMAD": (0.5, {"suppressive_activity": 0.3}),
+        "IL2_JAK_STAT5": (0.0, {"IL2": 1.2}),
+    },
+    "Macrophage": {
+        "NFkB": (0.0, {"IFN_gamma": 1.0}),
+        "TGFb_SMAD": (0.0, {"TGF_beta": 0.8}),
+        # M1 vs M2 极化: M2 信号 (TGF-β + 0.3·IL-2) − M1 信号 (IFN-γ)
+        "polarization": (0.0, {"TGF_beta": 1.0, "IL2": 0.3, "IFN_gamma": -1.0}),
+    },
+}
+
+# 通用代谢通路（所有类型）
+COMMON_PATHWAYS = {
+    "mTOR": (0.0, {"glucose": 0.15, "oxygen": 5.0}),
+    # (0.03 - O2) × 15 + (2.0 - glucose) × 0.3
+    "AMPK": (1.05, {"oxygen": -15.0, "glucose": -0.3}),
+}
+
+# 写回细胞状态（而非通路）的输出
+STATE_OUTPUTS = ("polarization",)
+
+# 基因敲除 → 通路映射
+GENE_PATHWAY_MAP = {
+    "PDCD1": "PD1",           # PD1_KO → p.PD1 = 0
+    "CTLA4": "CTLA4",         # CTLA4_KO → p.CTLA4 = 0
+    "TGFB1": "TGFb_SMAD",     # TGFB_KO → p.TGFb_SMAD = 0
+    "TGFBR1": "TGFb_SMAD",
+    "TGFBR2": "TGFb_SMAD",
+    "TP53": "caspase",        # TP53_KO → p.caspase 受影响
+    "IFNG": "IFNg_JAK_STAT1", # IFNG_KO → p.IFNg_JAK_STAT1 = 0
+}
+
+
+def model_for(cell_type: str) -> Dict[str, Tuple[float, Dict[str, float]]]:
+    """某细胞类型的完整系数表（类型特异 + 通用代谢）"""
+    return {**PATHWAY_MODEL.get(cell_type, {}), **COMMON_PATHWAYS}
+
+
+def _sigmoid(x: float) -> float:
+    """Sigmoid 函数，输出 [0, 1]"""
+    return 1.0 / (1.0 + math.exp(-max(-20, min(20, x))))
+
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    """向量化 sigmoid（与 _sigmoid 相同的 ±20 截断）"""
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -20, 20)))
+
+
+def evaluate_scalar(cell_type: str, inputs: Dict[str, float]) -> Dict[str, float]:
+    """按表逐项求值单个细胞，返回 {输出: 激活分数}"""
+    values = dict(inputs)
+    out = {}
+    for name, (bias, coefs) in model_for(cell_type).items():
+        z = bias
+        for key, coef in coefs.items():
+            z += coef * values[key]
+        values[name] = out[name] = _sigmoid(z)
+    return out
+
+
+def knockout_factors(perturbations: dict, cell_type: str) -> List[Tuple[str, float]]:
+    """基因敲除对通路的乘性效应 [(通路, 系数)]，不适用时返回空列表"""
+    if not perturbations or perturbations.get("type") != "knockout":
+        return []
+    # 检查是否适用于当前细胞类型
+    target_cell_type = perturbations.get("cell_type")
+    if target_cell_type and target_cell_type != cell_type:
+        return []
+    factors = []
+    for gene in perturbations.get("active_genes", []):
+        pathway = GENE_PATHWAY_MAP.get(gene)
+        if pathway:
+            # TP53 KO 降低凋亡敏感性（caspase 减半），其他 KO 直接归零
+            factors.append((pathway, 0.5 if gene == "TP53" else 0.0))
+    return factors
+
+
+class PathwayStage:
+    """一层批量求值: outputs = sigmoid(inputs @ weights.T + bias)"""
+
+    def __init__(self, outputs: List[str], inputs: Tuple[str, ...],
+                 weights: np.ndarray, bias: np.ndarray):
+        self.outputs = outputs
+        self.inputs = inputs
+        self.weights = weights
+        self.bias = bias
+
+
+def compile_stages(cell_type: str, pathway_fields: Tuple[str, ...]) -> List[PathwayStage]:
+    """把系数表编译为按依赖分层的矩阵：只依赖已算出输出的项放在同一层"""
+    inputs = FEATURES + tuple(pathway_fields)
+    col = {name: j for j, name in enumerate(inputs)}
+    pending = list(model_for(cell_type).items())
+    stages = []
+    done = set()
+    while pending:
+        layer = [(name, spec) for name, spec in pending
+                 if all(k in FEATURES or k in done for k in spec[1])]
+        if not layer:
+            raise ValueError(f"Circular pathway dependency for {cell_type}")
+        weights = np.zeros((len(layer), len(inputs)))
+        bias = np.zeros(len(layer))
+        for i, (name, (b, coefs)) in enumerate(layer):
+            bias[i] = b
+            for key, coef in coefs.items():
+                weights[i, col[key]] = coef
+        stages.append(PathwayStage([name for name, _ in layer], inputs, weights, bias))
+        done.update(name for name, _ in layer)
+        pending = [(name, spec) for name, spec in pending if name not in done]
+    return stages
@@ -0,0 +1,463 @@
+"""
+CellSwarm v2 - 细胞群体（Structure-of-Arrays）
+
+所有细胞状态存放在连续的 NumPy 数组中，每个属性一列，每个细胞一行：
+- 数值列：能量、激活度、耗竭、周期计时器、位置等（3D 网格时位置为 (x, y, z)）
+- 类型列：CellType / CyclePhase 以 int8 编码（编码 = CELL_TYPES / CYCLE_PHASES 中的下标）
+- 通路矩阵：(n_cells × 14)，列顺序见 PATHWAY_FIELDS
+- 决策列：action（int8 动作编码）+ migrate_delta；规则引擎只写这两列和规则经历列
+- 规则经历列：rule_step / rule_action / rule_delta / rule_top / rule_top_value 为每行一个定长环形，
+  规则步批量写入；读取 CellView.memory 时才按时间顺序回放进该行的 CellMemory
+- 对象列：last_decision / memory / local_env（只有 LLM 路径会用到）
+
+env / rules / lifecycle / stats 可对整个群体做向量化运算；
+LLM 路径通过 CellView（Cell 的轻量视图）按行读写同一份数组。
+"""
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from .cell import (Cell, CellMemory, CellType, CyclePhase, PathwayState,
+                   PATHWAY_FIELDS, SENSED_FIELDS, SHORT_TERM_SIZE)
+from .pathways import FEATURES, STATE_OUTPUTS, compile_stages, knockout_factors, sigmoid
+
+CELL_TYPES = tuple(CellType)
+CYCLE_PHASES = tuple(CyclePhase)
+TYPE_CODE = {t: i for i, t in enumerate(CELL_TYPES)}
+PHASE_CODE = {p: i for i, p in enumerate(CYCLE_PHASES)}
+N_PATHWAYS = len(PATHWAY_FIELDS)
+
+# 动作编码（= ACTIONS 中的下标，-1 表示无决策或未知动作）
+ACTIONS = ("rest", "attack", "migrate", "proliferate", "secrete",
+           "evade", "suppress", "signal", "apoptosis")
+ACTION_CODE = {a: i for i, a in enumerate(ACTIONS)}
+NO_ACTION = -1
+
+# 每种细胞类型编译好的通路系数矩阵（按依赖分层）
+PATHWAY_STAGES = {t: compile_stages(t.value, PATHWAY_FIELDS) for t in CELL_TYPES}
+
+# 列名 → (dtype, 每行形状)；列名与 Cell 属性名一致，SPATIAL_COLUMNS 的最后一维为网格维数
+SPATIAL_COLUMNS = ("position", "migrate_delta", "rule_delta")
+COLUMNS = {
+    "id": (np.int64, ()),
+    "cell_type": (np.int8, ()),
+    "position": (np.intp, (2,)),
+    "alive": (np.bool_, ()),
+    "age": (np.int32, ()),
+    "division_count": (np.int32, ()),
+    "energy": (np.float64, ()),
+    "activation": (np.float64, ()),
+    "exhaustion": (np.float64, ()),
+    "proliferation_rate": (np.float64, ()),
+    "immune_evasion": (np.float64, ()),
+    "suppressive_activity": (np.float64, ()),
+    "polarization": (np.float64, ()),
+    "cycle_phase": (np.int8, ()),
+    "cycle_timer": (np.float64, ()),
+    "pathways": (np.float64, (N_PATHWAYS,)),
+    "action": (np.int8, ()),
+    "migrate_delta": (np.int8, (2,)),
+    "last_decision": (object, ()),
+    "last_llm_step": (np.int32, ()),
+    "memory": (object, ()),
+    "local_env": (object, ()),
+    # 尚未回放进 CellMemory 的规则经历（step = -1 为空位），top-3 通路为下标 + 原始值
+    "rule_step": (np.int32, (SHORT_TERM_SIZE,)),
+    "rule_action": (np.int8, (SHORT_TERM_SIZE,)),
+    "rule_delta": (np.int8, (SHORT_TERM_SIZE, 2)),
+    "rule_top": (np.int8, (SHORT_TERM_SIZE, 3)),
+    "rule_top_value": (np.float64, (SHORT_TERM_SIZE, 3)),
+    "rule_head": (np.int8, ()),
+}
+
+# 新细胞的缺省值（与 Cell.__init__ 一致），未列出的列为 0 / None
+COLUMN_DEFAULTS = {
+    "alive": True,
+    "energy": 0.8,
+    "polarization": 0.5,
+    "cycle_phase": CYCLE_PHASES.index(CyclePhase.G0),
+    "action": NO_ACTION,
+    "last_llm_step": -999,
+    "rule_step": -1,
+}
+
+
+def action_code(decision: Optional[dict]) -> int:
+    """决策 dict → 动作编码"""
+    action = (decision or {}).get("action")
+    return ACTION_CODE.get(action, NO_ACTION) if isinstance(action, str) else NO_ACTION
+
+
+def rule_decision(code: int, delta: np.ndarray) -> dict:
+    """动作编码 + 迁移方向 → 与 Cell.apply_rule_based_decision 同格式的决策 dict"""
+    params = {}
+    if ACTIONS[code] == "migrate":
+        params = {k: int(d) for k, d in zip(("dx", "dy", "dz"), delta)}
+    return {"action": ACTIONS[code], "params": params, "source": "rule"}
+
+
+def top_signals(pathways: np.ndarray) -> np.ndarray:
+    """(n, n_pathways) → 每行绝对值最大的 3 条通路下标 (n, 3)
+
+    与 CellMemory._top_signals 相同：按保留 3 位小数后的绝对值降序，同值按通路顺序
+    （舍入用 np.round，只在恰好落在舍入边界上的值与 Python round 可能不同）。
+    """
+    rounded = np.abs(np.round(pathways, 3))
+    return np.argsort(-rounded, axis=1, kind="stable")[:, :3]
+
+
+def _object_array(values: list) -> np.ndarray:
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+class CellPopulation:
+    """细胞群体容器：每列一个 NumPy 数组，行号即细胞下标"""
+
+    def __init__(self, perturbations: Optional[dict] = None, ndim: int = 2):
+        # 扰动配置对同一模拟的所有细胞相同，只存一份
+        self.perturbations = perturbations or {}
+        self.ndim = ndim
+        for name, (dtype, shape) in self._columns():
+            setattr(self, name, np.empty((0,) + shape, dtype=dtype))
+
+    def _columns(self):
+        """(列名, (dtype, 每行形状))，空间列的最后一维按网格维数"""
+        for name, (dtype, shape) in COLUMNS.items():
+            yield name, (dtype, shape[:-1] + (self.ndim,) if name in SPATIAL_COLUMNS else shape)
+
+    @classmethod
+    def from_cells(cls, cells: Iterable[Cell], perturbations: Optional[dict] = None,
+                   ndim: int = 2) -> "CellPopulation":
+        pop = cls(perturbations, ndim)
+        pop.extend(cells)
+        return pop
+
+    # ── 行管理 ──────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def __iter__(self) -> Iterator["CellView"]:
+        for row in range(len(self)):
+            yield CellView(self, row)
+
+    def __getitem__(self, row: int) -> "CellView":
+        return CellView(self, int(row))
+
+    def extend(self, cells: Iterable[Cell]):
+        """把 Cell 对象追加为新行（每列一次拼接）"""
+        cells = list(cells)
+        if not cells:
+            return
+        rows = self.new_rows(len(cells))
+        rows.update({
+            "id": np.array([c.id for c in cells], dtype=np.int64),
+            "cell_type": np.array([TYPE_CODE[c.cell_type] for c in cells], dtype=np.int8),
+            "position": np.array([c.position for c in cells], dtype=np.intp).reshape(-1, self.ndim),
+            "alive": np.array([c.alive for c in cells], dtype=np.bool_),
+            "age": np.array([c.age for c in cells], dtype=np.int32),
+            "division_count": np.array([c.division_count for c in cells], dtype=np.int32),
+            "cycle_phase": np.array([PHASE_CODE[c.cycle_phase] for c in cells], dtype=np.int8),
+            "pathways": np.array([[getattr(c.pathways, k) for k in PATHWAY_FIELDS]
+                                  for c in cells], dtype=np.float64),
+            "action": np.array([action_code(c.last_decision) for c in cells], dtype=np.int8),
+            "migrate_delta": np.zeros((len(cells), self.ndim), dtype=np.int8),
+            "last_decision": _object_array([c.last_decision for c in cells]),
+            "last_llm_step": np.array([c.last_llm_step for c in cells], dtype=np.int32),
+            "memory": _object_array([c.memory for c in cells]),
+            "local_env": _object_array([c.local_env for c in cells]),
+        })
+        for name in ("energy", "activation", "exhaustion", "proliferation_rate",
+                     "immune_evasion", "suppressive_activity", "polarization", "cycle_timer"):
+            rows[name] = np.array([getattr(c, name) for c in cells], dtype=np.float64)
+        self.append_rows(rows)
+
+    def new_rows(self, n: int) -> Dict[str, np.ndarray]:
+        """n 个新细胞的缺省列（供批量创建后再覆盖部分列）"""
+        rows = {}
+        for name, (dtype, shape) in self._columns():
+            if dtype is object:
+                rows[name] = np.full(n, None, dtype=object)
+            else:
+                rows[name] = np.full((n,) + shape, COLUMN_DEFAULTS.get(name, 0), dtype=dtype)
+        return rows
+
+    def append_rows(self, rows: Dict[str, np.ndarray]) -> np.ndarray:
+        """按列追加一批新行（每列只分配一次），返回新行的行号"""
+        start = len(self)
+        for name in COLUMNS:
+            setattr(self, name, np.concatenate([getattr(self, name), rows[name]]))
+        return np.arange(start, len(self))
+
+    def compact(self) -> int:
+        """删除死亡细胞的行（存活行保持原相对顺序），返回删除的行数
+
+        行号随之改变，只能在一步结束、没有持有行号时调用。
+        """
+        keep = self.alive
+        removed = len(keep) - int(np.count_nonzero(keep))
+        if removed:
+            for name in COLUMNS:
+                setattr(self, name, getattr(self, name)[keep])
+        return removed
+
+    # ── 规则经历 ────────────────────────────────────────────
+
+    def record_rule_experience(self, rows: np.ndarray, step: int, action: np.ndarray):
+        """规则决策的经历批量写入 rows 的环形列（等价于逐细胞 add_experience）"""
+        head = self.rule_head[rows].astype(np.intp)
+        top = top_signals(self.pathways[rows])
+        self.rule_step[rows, head] = step
+        self.rule_action[rows, head] = action
+        self.rule_delta[rows, head] = self.migrate_delta[rows]
+        self.rule_top[rows, head] = top
+        self.rule_top_value[rows, head] = np.take_along_axis(self.pathways[rows], top, axis=1)
+        self.rule_head[rows] = (head + 1) % SHORT_TERM_SIZE
+
+    def flush_rule_memory(self, row: int, memory: CellMemory):
+        """把 row 尚未回放的规则经历按时间顺序追加进 memory，并清空环形列
+
+        CellMemory 中的记录只会经 CellView.memory 写入（先回放），因此总是早于环形列中的记录。
+        """
+        steps = self.rule_step[row]
+        if steps.max() < 0:
+            return
+        head = int(self.rule_head[row])
+        for k in [*range(head, SHORT_TERM_SIZE), *range(head)]:
+            if steps[k] < 0:
+                continue
+            code = self.rule_action[row, k]
+            top = zip(self.rule_top[row, k].tolist(), self.rule_top_value[row, k].tolist())
+            memory.append_entry((int(steps[k]), rule_decision(code, self.rule_delta[row, k]),
+                                 ACTIONS[code], *(x for i, v in top for x in (i, round(v, 3)))))
+        steps[:] = -1
+        self.rule_head[row] = 0
+
+    # ── 查询 ────────────────────────────────────────────────
+
+    def alive_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def alive_count(self) -> int:
+        return int(np.count_nonzero(self.alive))
+
+    def rows_of_type(self, cell_type: CellType, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """存活细胞中某类型的行号"""
+        if rows is None:
+            rows = self.alive_rows()
+        return rows[self.cell_type[rows] == TYPE_CODE[cell_type]]
+
+    def pathway(self, name: str) -> np.ndarray:
+        """通路矩阵中某一列（视图，可原地修改）"""
+        return self.pathways[:, PATHWAY_FIELDS.index(name)]
+
+    # ── 向量化内核 ──────────────────────────────────────────
+
+    def compute_pathways(self, rows: np.ndarray, env_snapshot: dict,
+                         tumor_neighbors: np.ndarray):
+        """批量计算通路（与 Cell.compute_pathways 使用同一份系数表）
+
+        rows 为存活细胞行号，与 env_snapshot["values"] 的行一一对应；
+        tumor_neighbors 为每行附近的肿瘤细胞数。
+        """
+        values, columns = env_snapshot["values"], env_snapshot["columns"]
+        features = np.empty((len(rows), len(FEATURES)))
+        for name, default in SENSED_FIELDS:
+            j = FEATURES.index(name)
+            features[:, j] = values[:, columns[name]] if name in columns else default
+        features[:, FEATURES.index("tumor_neighbors")] = tumor_neighbors
+        for name in ("activation", "exhaustion", "proliferation_rate", "suppressive_activity"):
+            features[:, FEATURES.index(name)] = getattr(self, name)[rows]
+
+        codes = self.cell_type[rows]
+        for code, cell_type in enumerate(CELL_TYPES):
+            sel = codes == code
+            if not sel.any():
+                continue
+            r, x = rows[sel], features[sel]
+            for stage in PATHWAY_STAGES[cell_type]:
+                out = sigmoid(np.hstack([x, self.pathways[r]]) @ stage.weights.T + stage.bias)
+                for i, name in enumerate(stage.outputs):
+                    if name in STATE_OUTPUTS:
+                        getattr(self, name)[r] = out[:, i]
+                    else:
+                        self.pathways[r, PATHWAY_FIELDS.index(name)] = out[:, i]
+            # 应用基因敲除扰动
+            for pathway, factor in knockout_factors(self.perturbations, cell_type.value):
+                self.pathways[r, PATHWAY_FIELDS.index(pathway)] *= factor
+
+    def memory_report(self) -> Dict[str, int]:
+        """每列占用的字节数（对象列只计引用数组，不含所指对象）"""
+        return {f"column:{name}": getattr(self, name).nbytes for name in COLUMNS}
+
+    def type_counts(self) -> Dict[str, int]:
+        """存活细胞按类型计数（键按首次出现顺序）"""
+        return self._counts(self.cell_type, CELL_TYPES)
+
+    def phase_counts(self) -> Dict[str, int]:
+        """存活细胞按周期相计数（键按首次出现顺序）"""
+        return self._counts(self.cycle_phase, CYCLE_PHASES)
+
+    def _counts(self, codes: np.ndarray, enum_values: tuple) -> Dict[str, int]:
+        codes = codes[self.alive]
+        uniq, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        return {enum_values[uniq[i]].value: int(counts[i]) for i in order}
+
+
+# ── Cell 视图 ───────────────────────────────────────────────
+
+def _column(name: str, cast):
+    def fget(self):
+        return cast(getattr(self._pop, name)[self._row])
+
+    def fset(self, value):
+        getattr(self._pop, name)[self._row] = value
+    return property(fget, fset)
+
+
+class PathwayView(PathwayState):
+    """CellPopulation.pathways 中一行的视图"""
+    __slots__ = ("_pop", "_row")
+
+    def __init__(self, population: CellPopulation, row: int):
+        self._pop = population
+        self._row = row
+
+
+def _pathway_column(j: int):
+    def fget(self):
+        return float(self._pop.pathways[self._row, j])
+
+    def fset(self, value):
+        self._pop.pathways[self._row, j] = value
+    return property(fget, fset)
+
+
+for _j, _name in enumerate(PATHWAY_FIELDS):
+    setattr(PathwayView, _name, _pathway_column(_j))
+
+
+class CellView(Cell):
+    """CellPopulation 中一行的轻量 Cell 视图（LLM 路径使用）
+
+    不调用 Cell.__init__：所有状态都直接读写 population 的数组，
+    因此 Cell 的方法（to_prompt_context / apply_llm_decision / snapshot 等）
+    可以原样作用在群体上。
+    """
+    __slots__ = ("_pop", "_row")
+
+    def __init__(self, population: CellPopulation, row: int):
+        self._pop = population
+        self._row = row
+
+    id = _column("id", int)
+    alive = _column("alive", bool)
+    age = _column("age", int)
+    division_count = _column("division_count", int)
+    energy = _column("energy", float)
+    activation = _column("activation", float)
+    exhaustion = _column("exhaustion", float)
+    proliferation_rate = _column("proliferation_rate", float)
+    immune_evasion = _column("immune_evasion", float)
+    suppressive_activity = _column("suppressive_activity", float)
+    polarization = _column("polarization", float)
+    cycle_timer = _column("cycle_timer", float)
+    last_llm_step = _column("last_llm_step", int)
+
+    @property
+    def local_env(self) -> dict:
+        return self._pop.local_env[self._row] or {}
+
+    @local_env.setter
+    def local_env(self, value: dict):
+        self._pop.local_env[self._row] = value
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def cell_type(self) -> CellType:
+        return CELL_TYPES[self._pop.cell_type[self._row]]
+
+    @cell_type.setter
+    def cell_type(self, value: CellType):
+        self._pop.cell_type[self._row] = TYPE_CODE[value]
+
+    @property
+    def cycle_phase(self) -> CyclePhase:
+        return CYCLE_PHASES[self._pop.cycle_phase[self._row]]
+
+    @cycle_phase.setter
+    def cycle_phase(self, value: CyclePhase):
+        self._pop.cycle_phase[self._row] = PHASE_CODE[value]
+
+    @property
+    def position(self) -> tuple:
+        return tuple(int(c) for c in self._pop.position[self._row])
+
+    @position.setter
+    def position(self, value: tuple):
+        # Cell 的迁移逻辑只改 (x, y)，3D 时保留 z
+        self._pop.position[self._row, :len(value)] = [int(c) for c in value]
+
+    @property
+    def pathways(self) -> PathwayView:
+        return PathwayView(self._pop, self._row)
+
+    @pathways.setter
+    def pathways(self, value: PathwayState):
+        self._pop.pathways[self._row] = [getattr(value, k) for k in PATHWAY_FIELDS]
+
+    @property
+    def last_decision(self) -> Optional[dict]:
+        """LLM/随机决策原样返回；规则决策由动作编码还原为同样格式的 dict"""
+        decision = self._pop.last_decision[self._row]
+        code = self._pop.action[self._row]
+        if decision is None and code != NO_ACTION:
+            decision = rule_decision(code, self._pop.migrate_delta[self._row])
+        return decision
+
+    @last_decision.setter
+    def last_decision(self, value: Optional[dict]):
+        self._pop.last_decision[self._row] = value
+        self._pop.action[self._row] = action_code(value)
+
+    @property
+    def memory(self) -> CellMemory:
+        memory = self._pop.memory[self._row]
+        if memory is None:
+            memory = self._pop.memory[self._row] = CellMemory()
+        self._pop.flush_rule_memory(self._row, memory)
+        return memory
+
+    @memory.setter
+    def memory(self, value: CellMemory):
+        self._pop.memory[self._row] = value
+
+    @property
+    def perturbations(self) -> dict:
+        return self._pop.perturbations
+
+    @perturbations.setter
+    def perturbations(self, value: dict):
+        self._pop.perturbations = value or {}
+
+
+class RowViews:
+    """一组行的 CellView 序列，按需构造（向量化路径直接用 rows，不为每个细胞建视图）"""
+
+    def __init__(self, population: CellPopulation, rows: np.ndarray):
+        self._pop = population
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[CellView]:
+        pop = self._pop
+        for row in self.rows.tolist():
+            yield CellView(pop, row)
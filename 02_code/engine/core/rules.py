@@ -0,0 +1,95 @@
+"""
+CellSwarm v2 - 向量化规则决策引擎
+
+与 Cell.apply_rule_based_decision 相同的规则，但对整个 CellPopulation 一次求值：
+用通路/能量数组上的掩码算出每个细胞的动作编码，再批量应用
+能量、激活度、耗竭等效应。结果只写入 action / migrate_delta 两列，
+CellView.last_decision 会按需把编码还原成原来的决策 dict；
+每步的规则经历批量写入 CellPopulation 的规则经历列（见 record_rule_experience）。
+"""
+import numpy as np
+
+from .cell import CellType, CyclePhase, PATHWAY_FIELDS
+from .population import ACTION_CODE, CellPopulation, PHASE_CODE, TYPE_CODE
+
+_ATTACKERS = np.array([TYPE_CODE[t] for t in
+                       (CellType.CD8_T, CellType.NK, CellType.MACROPHAGE)], dtype=np.int8)
+
+
+def rule_actions(pop: CellPopulation, rows: np.ndarray) -> np.ndarray:
+    """按规则为 rows 计算动作编码（if/elif 链 → 按顺序的条件表，先命中者生效）"""
+    p = pop.pathways[rows]
+
+    def pw(name: str) -> np.ndarray:
+        return p[:, PATHWAY_FIELDS.index(name)]
+
+    energy = pop.energy[rows]
+    codes = pop.cell_type[rows]
+
+    def of(cell_type: CellType) -> np.ndarray:
+        return codes == TYPE_CODE[cell_type]
+
+    cd8, tumor, treg = of(CellType.CD8_T), of(CellType.TUMOR), of(CellType.TREG)
+    macro, nk, b_cell = of(CellType.MACROPHAGE), of(CellType.NK), of(CellType.B_CELL)
+    net_activation = pw("TCR") + pw("CD28") - pw("PD1") - pw("CTLA4")
+
+    table = [
+        (cd8 & (net_activation > 0.5) & (energy > 0.3), "attack"),
+        (cd8 & (pw("IL2_JAK_STAT5") > 0.6) & (energy > 0.5), "proliferate"),
+        (tumor & (pw("MAPK_ERK") > 0.5) & (energy > 0.4), "proliferate"),
+        (tumor & (pw("caspase") > 0.6), "apoptosis"),
+        (tumor & (pw("HIF1a") > 0.5), "migrate"),
+        (treg & (pw("IL2_JAK_STAT5") > 0.5), "suppress"),
+        (macro & (pop.polarization[rows] < 0.4), "attack"),  # M1
+        (macro, "secrete"),  # M2
+        (nk & (pw("NFkB") > 0.5) & (energy > 0.3), "attack"),
+        (nk & (pw("IFNg_JAK_STAT1") > 0.4), "signal"),
+        (b_cell & (pw("NFkB") > 0.5) & (energy > 0.4), "signal"),
+        (b_cell & (pw("IL2_JAK_STAT5") > 0.6), "proliferate"),
+    ]
+    return np.select([cond for cond, _ in table],
+                     [ACTION_CODE[action] for _, action in table],
+                     default=ACTION_CODE["rest"]).astype(np.int8)
+
+
+def apply_rule_decisions(pop: CellPopulation, rows: np.ndarray,
+                         rng: np.random.Generator, step: int) -> np.ndarray:
+    """规则决策 + 批量应用动作效应（与 apply_llm_decision 的效应一致），返回动作编码"""
+    action = rule_actions(pop, rows)
+    codes = pop.cell_type[rows]
+
+    # 迁移方向：每个方向分量从 {-1, 0, 1} 随机取
+    migrate = action == ACTION_CODE["migrate"]
+    ndim = pop.position.shape[1]
+    delta = np.zeros((len(rows), ndim), dtype=np.int8)
+    delta[migrate] = rng.integers(-1, 2, size=(int(migrate.sum()), ndim))
+
+    pop.action[rows] = action
+    pop.migrate_delta[rows] = delta
+    pop.last_decision[rows] = None
+
+    r = rows[(action == ACTION_CODE["attack"]) & np.isin(codes, _ATTACKERS)]
+    pop.activation[r] = np.minimum(1.0, pop.activation[r] + 0.2)
+    pop.energy[r] -= 0.15
+    pop.exhaustion[r] += 0.05
+
+    r = rows[migrate]
+    pop.position[r] = np.maximum(0, pop.position[r] + delta[migrate])
+    pop.energy[r] -= 0.05
+
+    r = rows[action == ACTION_CODE["proliferate"]]
+    r = r[pop.cycle_phase[r] == PHASE_CODE[CyclePhase.G0]]
+    pop.cycle_phase[r] = PHASE_CODE[CyclePhase.G1]
+    pop.cycle_timer[r] = 0
+
+    r = rows[action == ACTION_CODE["rest"]]
+    pop.energy[r] = np.minimum(1.0, pop.energy[r] + 0.1)
+    # 休息时降低耗竭
+    r = r[pop.exhaustion[r] > 0]
+    pop.exhaustion[r] = np.maximum(0, pop.exhaustion[r] - 0.02)
+
+    r = rows[(action == ACTION_CODE["suppress"]) & (codes == TYPE_CODE[CellType.TREG])]
+    pop.suppressive_activity[r] = np.minimum(1.0, pop.suppressive_activity[r] + 0.1)
+
+    pop.record_rule_experience(rows, step, action)
+    return action
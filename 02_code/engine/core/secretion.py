@@ -0,0 +1,181 @@
+"""
+CellSwarm v2 - 批量分泌与消耗
+
+每个场的分泌/消耗写成按细胞类型的速率表（与 KB5 engine_params.fields.* 同格式）：
+
+    consumption: {细胞类型: 速率}            "*" 为其余类型的兜底值
+    secretion:   {细胞类型: {rate, condition, scale, induction}}
+        condition  如 "action==attack" / "HIF1a>0.5" / "polarization>=0.6"
+        scale      速率再乘以该细胞属性（如 immune_evasion）
+        induction  {场名: 系数}，按所在像素的场值额外分泌（PD-L1 受 IFN-γ 诱导）
+
+SecretionStage 把速率表编译成按类型编码索引的数组，每步对所有存活细胞一次性算出
+每个场的净变化量，再用 np.add.at 按位置累加，开销与数组大小相关而不是 Python 循环次数。
+"""
+import operator
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .cell import CellType, PATHWAY_FIELDS
+from .population import ACTION_CODE, CELL_TYPES, CellPopulation, TYPE_CODE, action_code
+
+# 无 KB 时的默认速率表（即原 Environment.step 中的硬编码规则）
+DEFAULT_RATES: Dict[str, dict] = {
+    "oxygen": {"consumption": {"Tumor": 0.002, "*": 0.001}},
+    "glucose": {"consumption": {"Tumor": 0.1, "*": 0.05}},
+    "IFN_gamma": {"secretion": {
+        "CD8_T": {"rate": 0.05, "condition": "action==attack"},
+        "Macrophage": {"rate": 0.03, "condition": "polarization<0.4"},  # M1
+    }},
+    "PD_L1": {"secretion": {
+        "Tumor": {"rate": 0.02, "scale": "immune_evasion"},
+    }},
+    "TGF_beta": {"secretion": {
+        "Tumor": {"rate": 0.03, "condition": "HIF1a>0.5"},
+        "Treg": {"rate": 0.04, "scale": "suppressive_activity"},
+        "Macrophage": {"rate": 0.02, "condition": "polarization>=0.4"},  # M2
+    }},
+    "IL2": {"consumption": {"Treg": 0.02}},
+}
+
+_OPS = {"==": operator.eq, ">=": operator.ge, "<=": operator.le,
+        ">": operator.gt, "<": operator.lt}
+_CONDITION = re.compile(r"^\s*(\w+)\s*(==|>=|<=|>|<)\s*(\S+)\s*$")
+
+
+def rate_tables(kb_fields: Optional[dict] = None,
+                baseline: Optional[dict] = None) -> Dict[str, dict]:
+    """合并默认表与 KB5 场参数：KB 给出 consumption/secretion 的场整项覆盖默认值，
+    KB 消耗表未列出的类型使用 shared_defaults.baseline_consumption"""
+    tables = {name: dict(spec) for name, spec in DEFAULT_RATES.items()}
+    for name, params in (kb_fields or {}).items():
+        if "consumption" not in params and "secretion" not in params:
+            continue
+        table = {}
+        if params.get("consumption"):
+            table["consumption"] = dict(params["consumption"])
+            if baseline and name in baseline:
+                table["consumption"].setdefault("*", baseline[name])
+        if params.get("secretion"):
+            table["secretion"] = {t: dict(spec) for t, spec in params["secretion"].items()}
+        # IFN-γ 诱导的 PD-L1 表达
+        if params.get("ifng_induction") and "Tumor" in table.get("secretion", {}):
+            table["secretion"]["Tumor"]["induction"] = {"IFN_gamma": params["ifng_induction"]}
+        tables[name] = table
+    return tables
+
+
+class CellColumns:
+    """存活细胞的列视图：CellPopulation 直接切片，Cell 列表按需逐个取值"""
+
+    def __init__(self, cells):
+        if isinstance(cells, CellPopulation):
+            self._pop, self._rows = cells, cells.alive_rows()
+            self._cells = None
+            self.positions = cells.position[self._rows]
+            self.type_codes = cells.cell_type[self._rows]
+        else:
+            self._pop, self._rows = None, None
+            self._cells = [c for c in cells if c.alive]
+            self.positions = np.array([c.position for c in self._cells],
+                                      dtype=np.intp).reshape(-1, 2)
+            self.type_codes = np.array([TYPE_CODE[c.cell_type] for c in self._cells],
+                                       dtype=np.int8)
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.type_codes)
+
+    def get(self, name: str) -> np.ndarray:
+        """按名称取一列：action（编码）、通路分数或细胞状态属性"""
+        if name not in self._cache:
+            self._cache[name] = self._column(name)
+        return self._cache[name]
+
+    def _column(self, name: str) -> np.ndarray:
+        pop, rows = self._pop, self._rows
+        if name == "action":
+            if pop is not None:
+                return pop.action[rows]
+            return np.array([action_code(c.last_decision) for c in self._cells], dtype=np.int8)
+        if name in PATHWAY_FIELDS:
+            if pop is not None:
+                return pop.pathway(name)[rows]
+            return np.array([getattr(c.pathways, name) for c in self._cells], dtype=float)
+        if pop is not None:
+            return getattr(pop, name)[rows]
+        return np.array([getattr(c, name) for c in self._cells], dtype=float)
+
+
+class _Secretion:
+    """一条分泌规则（某类型细胞向某个场分泌）"""
+
+    def __init__(self, cell_type: str, spec: dict):
+        self.type_code = TYPE_CODE[CellType(cell_type)]
+        self.rate = float(spec.get("rate", 0.0))
+        self.scale = spec.get("scale")
+        self.induction = dict(spec.get("induction", {}))
+        self.condition = None
+        if spec.get("condition"):
+            m = _CONDITION.match(spec["condition"])
+            if not m:
+                raise ValueError(f"Unsupported secretion condition: {spec['condition']!r}")
+            key, op, value = m.groups()
+            value = ACTION_CODE[value] if key == "action" else float(value)
+            self.condition = (key, _OPS[op], value)
+
+    def amounts(self, cols: CellColumns, mask: np.ndarray,
+                local: Dict[str, np.ndarray]) -> np.ndarray:
+        """mask 选中细胞的分泌量"""
+        amount = np.full(int(mask.sum()), self.rate)
+        if self.scale:
+            amount *= cols.get(self.scale)[mask]
+        for name, coef in self.induction.items():
+            if name in local:
+                amount += coef * local[name][mask]
+        return amount
+
+    def select(self, cols: CellColumns) -> np.ndarray:
+        mask = cols.type_codes == self.type_code
+        if self.condition:
+            key, op, value = self.condition
+            mask &= op(cols.get(key), value)
+        return mask
+
+
+class SecretionStage:
+    """按速率表批量计算所有细胞的分泌与消耗"""
+
+    def __init__(self, tables: Dict[str, dict]):
+        self.consumption: Dict[str, np.ndarray] = {}
+        self.secretion: Dict[str, List[_Secretion]] = {}
+        for name, table in tables.items():
+            rates = table.get("consumption")
+            if rates:
+                by_code = np.full(len(CELL_TYPES), float(rates.get("*", 0.0)))
+                for t in CELL_TYPES:
+                    if t.value in rates:
+                        by_code[TYPE_CODE[t]] = rates[t.value]
+                self.consumption[name] = by_code
+            if table.get("secretion"):
+                self.secretion[name] = [_Secretion(t, spec)
+                                        for t, spec in table["secretion"].items()]
+
+    def field_deltas(self, cols: CellColumns,
+                     local: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """每个场每个细胞的净变化量 {场名: (n_cells,)}，local 为各细胞所在像素的场值"""
+        deltas = {}
+        for name in dict.fromkeys([*self.consumption, *self.secretion]):
+            if name not in local:
+                continue
+            delta = np.zeros(len(cols))
+            if name in self.consumption:
+                delta -= self.consumption[name][cols.type_codes]
+            for rule in self.secretion.get(name, []):
+                mask = rule.select(cols)
+                if mask.any():
+                    delta[mask] += rule.amounts(cols, mask, local)
+            deltas[name] = delta
+        return deltas
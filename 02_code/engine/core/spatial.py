@@ -0,0 +1,161 @@
+"""
+CellSwarm v2 - 空间索引
+
+均匀网格哈希（uniform grid）：按 bin_size × bin_size（3D 为 bin_size³）的桶对细胞分组，
+邻居查询只扫描查询窗口覆盖的桶，开销随局部密度增长而不是随总细胞数增长。
+位置可以是 (x, y) 或 (x, y, z)，同一索引内维数一致。
+
+每步由 Environment.register_cells 重建一次，细胞移动/分裂/死亡时增量更新。
+
+另附栅格工具：occupancy_raster / nearest_occupied 供战斗与趋化性一次性求最近目标。
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.ndimage import distance_transform_cdt
+
+
+class SpatialIndex:
+    """均匀网格空间索引 (cell_id → position)"""
+
+    def __init__(self, bin_size: int = 4):
+        self.bin_size = max(1, int(bin_size))
+        self._bins: Dict[Tuple[int, ...], List[str]] = {}
+        self._pos: Dict[str, Tuple[int, ...]] = {}
+        self._type: Dict[str, str] = {}
+        # 注册顺序，用于保证查询结果顺序与细胞列表顺序一致
+        self._rank: Dict[str, int] = {}
+        self._next_rank = 0
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def __contains__(self, cid) -> bool:
+        return cid in self._pos
+
+    def _key(self, *coords: int) -> Tuple[int, ...]:
+        return tuple(c // self.bin_size for c in coords)
+
+    def clear(self):
+        self._bins.clear()
+        self._pos.clear()
+        self._type.clear()
+        self._rank.clear()
+        self._next_rank = 0
+
+    def rebuild(self, ids: Sequence, positions: np.ndarray, cell_types: Sequence[str]):
+        """批量重建索引（positions 为 (n, 2) 或 (n, 3) 整数数组，注册顺序即 ids 顺序）"""
+        self.clear()
+        n = len(ids)
+        if n == 0:
+            return
+        positions = np.asarray(positions, dtype=np.intp).reshape(n, -1)
+        self._pos = dict(zip(ids, map(tuple, positions.tolist())))
+        self._type = dict(zip(ids, cell_types))
+        self._rank = dict(zip(ids, range(n)))
+        self._next_rank = n
+
+        # 按桶分组：稳定排序后切段，桶内保持注册顺序
+        bins = positions // self.bin_size
+        order = np.lexsort(bins.T[::-1])
+        bins = bins[order]
+        cuts = np.flatnonzero((np.diff(bins, axis=0) != 0).any(axis=1)) + 1
+        starts = np.concatenate([[0], cuts]).tolist()
+        ends = np.concatenate([cuts, [n]]).tolist()
+        keys = map(tuple, bins[starts].tolist())
+        sorted_ids = np.asarray(ids, dtype=object)[order]
+        for key, start, end in zip(keys, starts, ends):
+            self._bins[key] = sorted_ids[start:end].tolist()
+
+    def insert(self, cid, position: tuple, cell_type: str):
+        """加入一个细胞（已存在则视为移动）"""
+        if cid in self._pos:
+            self.move(cid, position)
+            return
+        pos = tuple(int(c) for c in position)
+        self._pos[cid] = pos
+        self._type[cid] = cell_type
+        self._rank[cid] = self._next_rank
+        self._next_rank += 1
+        self._bins.setdefault(self._key(*pos), []).append(cid)
+
+    def remove(self, cid):
+        """移除一个细胞（死亡）"""
+        pos = self._pos.pop(cid, None)
+        if pos is None:
+            return
+        self._type.pop(cid, None)
+        self._rank.pop(cid, None)
+        key = self._key(*pos)
+        bucket = self._bins[key]
+        bucket.remove(cid)
+        if not bucket:
+            del self._bins[key]
+
+    def move(self, cid, position: tuple):
+        """更新细胞位置，跨桶时才搬移"""
+        old = self._pos.get(cid)
+        if old is None:
+            return
+        pos = tuple(int(c) for c in position)
+        if old == pos:
+            return
+        self._pos[cid] = pos
+        old_key, new_key = self._key(*old), self._key(*pos)
+        if old_key != new_key:
+            bucket = self._bins[old_key]
+            bucket.remove(cid)
+            if not bucket:
+                del self._bins[old_key]
+            self._bins.setdefault(new_key, []).append(cid)
+
+    def position(self, cid) -> Optional[Tuple[int, ...]]:
+        return self._pos.get(cid)
+
+    def cell_type(self, cid) -> Optional[str]:
+        return self._type.get(cid)
+
+    def query(self, x: int, y: int, radius: int, z: Optional[int] = None) -> List[str]:
+        """返回 Chebyshev 距离 <= radius 的所有细胞 ID（按注册顺序），3D 索引需给出 z"""
+        if z is not None:
+            return self._query_3d(x, y, z, radius)
+        b = self.bin_size
+        found = []
+        for bx in range((x - radius) // b, (x + radius) // b + 1):
+            for by in range((y - radius) // b, (y + radius) // b + 1):
+                bucket = self._bins.get((bx, by))
+                if not bucket:
+                    continue
+                for cid in bucket:
+                    cx, cy = self._pos[cid]
+                    if abs(cx - x) <= radius and abs(cy - y) <= radius:
+                        found.append(cid)
+        found.sort(key=self._rank.__getitem__)
+        return found
+
+    def _query_3d(self, x: int, y: int, z: int, radius: int) -> List[str]:
+        b = self.bin_size
+        found = []
+        for bx in range((x - radius) // b, (x + radius) // b + 1):
+            for by in range((y - radius) // b, (y + radius) // b + 1):
+                for bz in range((z - radius) // b, (z + radius) // b + 1):
+                    for cid in self._bins.get((bx, by, bz), ()):
+                        cx, cy, cz = self._pos[cid]
+                        if max(abs(cx - x), abs(cy - y), abs(cz - z)) <= radius:
+                            found.append(cid)
+        found.sort(key=self._rank.__getitem__)
+        return found
+
+
+def occupancy_raster(positions: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """(n, d) 位置 → 每个像素（体素）上的细胞数（网格外的位置忽略），d = len(shape)"""
+    positions = np.asarray(positions, dtype=np.intp).reshape(-1, len(shape))
+    inside = ((positions >= 0) & (positions < np.array(shape))).all(axis=1)
+    occupancy = np.zeros(shape, dtype=np.int32)
+    np.add.at(occupancy, tuple(positions[inside].T), 1)
+    return occupancy
+
+
+def nearest_occupied(occupancy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """每个像素到最近占据像素的 Manhattan 距离及其坐标 (dist, (d, *shape) 索引)"""
+    return distance_transform_cdt(occupancy == 0, metric="taxicab", return_indices=True)
@@ -0,0 +1,99 @@
+"""
+CellSwarm v2 - 稀疏细胞因子场（活跃 tile 跟踪）
+
+IFN-γ / IL-2 / PD-L1 等场从 0 开始，大部分网格长期接近 0。把网格切成
+tile × tile 的块，只对"活跃"块做扩散、降解与钳位：
+- 有分泌/消耗写入的块标记为活跃（dirty）
+- 扩散前把活跃块向外扩一圈（显式格式每步最多传播 1 格，邻块边缘会被影响）
+- 钳位后块内 |u| 全部低于 floor 的块清零并释放
+
+活跃块的模板更新一次性 gather 成 (n_tiles, tile, tile) 批量计算，周期边界与
+运算顺序与 ExplicitSolver 相同，floor = 0 时结果与全网格更新逐位一致。
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+class ActiveTiles:
+    """单个场的活跃 tile 集合与基于 tile 的显式更新"""
+
+    def __init__(self, shape: Tuple[int, int], tile: int = 16, floor: float = 1e-6):
+        self.shape = nx, ny = tuple(shape)
+        self.tile = tile = max(1, int(tile))
+        self.floor = floor
+        ntx, nty = -(-nx // tile), -(-ny // tile)
+        self.active = np.zeros((ntx, nty), dtype=bool)
+        # 每个 tile 覆盖的行/列下标（末尾不足一块时重复最后一行/列，写回值相同）
+        self._ix = np.minimum(np.arange(ntx)[:, None] * tile + np.arange(tile), nx - 1)
+        self._iy = np.minimum(np.arange(nty)[:, None] * tile + np.arange(tile), ny - 1)
+
+    @property
+    def active_fraction(self) -> float:
+        return float(self.active.mean())
+
+    @property
+    def nbytes(self) -> int:
+        return self.active.nbytes + self._ix.nbytes + self._iy.nbytes
+
+    def mark(self, xs: np.ndarray, ys: np.ndarray):
+        """标记 (xs, ys) 所在的 tile 为活跃（网格外忽略）"""
+        xs = np.asarray(xs, dtype=np.intp)
+        ys = np.asarray(ys, dtype=np.intp)
+        inside = (xs >= 0) & (xs < self.shape[0]) & (ys >= 0) & (ys < self.shape[1])
+        self.active[xs[inside] // self.tile, ys[inside] // self.tile] = True
+
+    def mark_nonzero(self, field: np.ndarray):
+        """按场当前值重置：含 |u| > floor 的 tile 为活跃"""
+        tiles = np.argwhere(np.ones_like(self.active))
+        self.active = (self._tile_max(field, tiles) > self.floor).reshape(self.active.shape)
+
+    def _index(self, tiles: np.ndarray, dx: int = 0, dy: int = 0):
+        """tiles (n, 2) → 可广播的 (行, 列) 下标，(dx, dy) 为周期平移"""
+        ix = self._ix[tiles[:, 0]]
+        iy = self._iy[tiles[:, 1]]
+        if dx:
+            ix = (ix + dx) % self.shape[0]
+        if dy:
+            iy = (iy + dy) % self.shape[1]
+        return ix[:, :, None], iy[:, None, :]
+
+    def _tile_max(self, field: np.ndarray, tiles: np.ndarray) -> np.ndarray:
+        return np.abs(field[self._index(tiles)]).max(axis=(1, 2))
+
+    def _dilated(self) -> np.ndarray:
+        """活跃 tile 向外扩一圈（周期）"""
+        grown = self.active.copy()
+        for axis in (0, 1):
+            grown = grown | np.roll(grown, 1, axis=axis) | np.roll(grown, -1, axis=axis)
+        return grown
+
+    def diffuse(self, field: np.ndarray, diff: float, decay: float, dt: float, h: float):
+        """只对活跃 tile（含一圈邻块）做显式扩散 + 降解"""
+        self.active = self._dilated() if diff > 0 else self.active
+        tiles = np.argwhere(self.active)
+        if len(tiles) == 0:
+            return
+        center = field[self._index(tiles)]
+        if diff > 0:
+            laplacian = (
+                field[self._index(tiles, dx=-1)] + field[self._index(tiles, dx=1)] +
+                field[self._index(tiles, dy=-1)] + field[self._index(tiles, dy=1)] -
+                4 * center
+            ) / h ** 2
+            field[self._index(tiles)] = center + dt * (diff * laplacian - decay * center)
+        else:
+            # 不扩散的信号（如 PD-L1），只降解
+            field[self._index(tiles)] = center * (1 - decay * dt)
+
+    def clip_and_release(self, field: np.ndarray):
+        """活跃 tile 钳位为非负，|u| 全部低于 floor 的 tile 清零并释放"""
+        tiles = np.argwhere(self.active)
+        if len(tiles) == 0:
+            return
+        index = self._index(tiles)
+        values = np.clip(field[index], 0, None)
+        quiet = values.max(axis=(1, 2)) <= self.floor
+        values[quiet] = 0.0
+        field[index] = values
+        self.active[tiles[quiet, 0], tiles[quiet, 1]] = False
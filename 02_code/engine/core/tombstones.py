@@ -0,0 +1,76 @@
+"""
+CellSwarm v2 - 死亡细胞墓碑档案
+
+细胞死亡时写入一条紧凑记录（ID、类型、死亡步、死因、母细胞 ID），
+Simulation 定期把死亡细胞从 cells 中压缩掉，之后每步的扫描只与存活细胞数成正比；
+死亡细胞的信息仍可从档案和 Lineage 中还原。
+"""
+from typing import Dict, Sequence
+
+import numpy as np
+
+from .lineage import Lineage
+from .population import CELL_TYPES
+
+# 死因：starvation（决策后能量耗尽）/ apoptosis（生命周期中能量耗尽）/ killed（被杀伤）
+DEATH_CAUSES = ("starvation", "apoptosis", "killed")
+CAUSE_CODE = {c: i for i, c in enumerate(DEATH_CAUSES)}
+
+_FIELDS = {"id": np.int64, "cell_type": np.int8, "death_step": np.int32,
+           "cause": np.int8, "parent": np.int64}
+
+
+class Tombstones:
+    """死亡细胞档案（按列存储，容量按倍增扩展）"""
+
+    def __init__(self, lineage: Lineage, capacity: int = 1024):
+        self.lineage = lineage
+        self._n = 0
+        self._cols = {name: np.empty(max(1, capacity), dtype=dtype) for name, dtype in _FIELDS.items()}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def bury(self, ids: Sequence[int], type_codes: Sequence[int], step: int, cause: str):
+        """记录一批在 step 死亡的细胞（type_codes 为 CELL_TYPES 下标）"""
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(ids)
+        if n == 0:
+            return
+        if self._n + n > len(self._cols["id"]):
+            size = max(2 * len(self._cols["id"]), self._n + n)
+            for name, col in self._cols.items():
+                grown = np.empty(size, dtype=col.dtype)
+                grown[:self._n] = col[:self._n]
+                self._cols[name] = grown
+        end = self._n + n
+        self._cols["id"][self._n:end] = ids
+        self._cols["cell_type"][self._n:end] = type_codes
+        self._cols["death_step"][self._n:end] = step
+        self._cols["cause"][self._n:end] = CAUSE_CODE[cause]
+        self._cols["parent"][self._n:end] = self.lineage.parent[ids]
+        self._n = end
+
+    def counts(self) -> Dict[str, int]:
+        """按死因计数"""
+        counts = np.bincount(self.cause, minlength=len(DEATH_CAUSES))
+        return {cause: int(n) for cause, n in zip(DEATH_CAUSES, counts)}
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id.tolist(),
+            "type": [CELL_TYPES[c].value for c in self.cell_type.tolist()],
+            "death_step": self.death_step.tolist(),
+            "cause": [DEATH_CAUSES[c] for c in self.cause.tolist()],
+            "parent": self.parent.tolist(),
+        }
+
+
+def _column(name: str):
+    def fget(self) -> np.ndarray:
+        return self._cols[name][:self._n]
+    return property(fget)
+
+
+for _name in _FIELDS:
+    setattr(Tombstones, _name, _column(_name))
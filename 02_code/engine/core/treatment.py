@@ -0,0 +1,105 @@
+"""
+CellSwarm v2 - 治疗效应（按细胞类型批量应用）
+
+药物对某类存活细胞的状态 / 通路效应表示为 Effect 列表：
+- objects 引擎逐细胞应用（一次遍历，按细胞类型取效应）
+- population 引擎按类型掩码对整列一次应用，不为每行构造 CellView
+两条路径的逐元素运算相同，结果逐位一致。
+"""
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .cell import Cell, CellType, PATHWAY_FIELDS
+from .population import COLUMNS, CellPopulation
+
+PATHWAY_PREFIX = "pathways."
+
+
+class Effect(NamedTuple):
+    """一条治疗效应：attr 为 Cell 属性名，或 "pathways.<通路>" """
+    attr: str
+    op: str                        # scale / sub / increase / decrease，见 _OPS
+    value: float
+    cap: float = 1.0               # increase 的上限
+    above: Optional[float] = None  # 只作用于当前值 > above 的细胞
+    below: Optional[float] = None  # 只作用于当前值 < below 的细胞
+
+
+# op → (标量实现, 数组实现)
+_OPS = {
+    "scale": (lambda x, e: x * e.value, lambda x, e: x * e.value),
+    "sub": (lambda x, e: x - e.value, lambda x, e: x - e.value),
+    "increase": (lambda x, e: min(e.cap, x + e.value), lambda x, e: np.minimum(e.cap, x + e.value)),
+    "decrease": (lambda x, e: max(0, x - e.value), lambda x, e: np.maximum(0, x - e.value)),
+}
+
+
+def _selected(x, effect: Effect):
+    if effect.above is not None and x <= effect.above:
+        return False
+    if effect.below is not None and x >= effect.below:
+        return False
+    return True
+
+
+def _apply_to_cell(cell: Cell, effects: List[Effect]):
+    for effect in effects:
+        target, attr = cell, effect.attr
+        if attr.startswith(PATHWAY_PREFIX):
+            target, attr = cell.pathways, attr[len(PATHWAY_PREFIX):]
+        current = getattr(target, attr, None)
+        if current is None or not _selected(current, effect):
+            continue
+        setattr(target, attr, _OPS[effect.op][0](current, effect))
+
+
+def _column(pop: CellPopulation, attr: str) -> Optional[np.ndarray]:
+    """attr 对应的一维视图（数值状态列或通路矩阵的一列），没有时返回 None"""
+    if attr.startswith(PATHWAY_PREFIX):
+        name = attr[len(PATHWAY_PREFIX):]
+        return pop.pathway(name) if name in PATHWAY_FIELDS else None
+    dtype, shape = COLUMNS.get(attr, (None, None))
+    return getattr(pop, attr) if dtype is np.float64 and shape == () else None
+
+
+def _apply_to_rows(pop: CellPopulation, rows: np.ndarray, effects: List[Effect]):
+    for effect in effects:
+        col = _column(pop, effect.attr)
+        if col is None:
+            continue
+        r = rows
+        if effect.above is not None:
+            r = r[~(col[r] <= effect.above)]
+        if effect.below is not None:
+            r = r[~(col[r] >= effect.below)]
+        col[r] = _OPS[effect.op][1](col[r], effect)
+
+
+def apply_effects(cells, effects: Dict[CellType, List[Effect]]):
+    """对存活细胞按类型应用效应；cells 为 CellPopulation 或 Cell 列表"""
+    effects = {t: e for t, e in effects.items() if e}
+    if not effects:
+        return
+    if isinstance(cells, CellPopulation):
+        alive = cells.alive_rows()
+        for cell_type, type_effects in effects.items():
+            _apply_to_rows(cells, cells.rows_of_type(cell_type, alive), type_effects)
+        return
+    for cell in cells:
+        if cell.alive and cell.cell_type in effects:
+            _apply_to_cell(cell, effects[cell.cell_type])
+
+
+def parse_condition(condition: str) -> Dict[str, float]:
+    """Drug Library 的简单条件 "<参数> > x" / "<参数> < x" → Effect 的 above / below
+
+    与原逐细胞实现相同：阈值与被修改参数自身的当前值比较，无法解析的条件不过滤。
+    """
+    for sign, key in ((">", "above"), ("<", "below")):
+        if sign in condition:
+            try:
+                return {key: float(condition.split(sign)[1].strip())}
+            except ValueError:
+                return {}
+    return {}
@@ -0,0 +1,46 @@
+"""
+CellSwarm v2 - LLM 分诊（向量化）
+
+LLM 步中每个存活细胞按信号复杂度分流：复杂度 > call_threshold 的细胞调用 LLM，
+其余走规则。复杂度对整个 (n_cells × n_pathways) 通路矩阵一次算出，再一次划分成
+LLM / 规则两组下标，并按细胞类型给出复杂度直方图供监控。
+
+复杂度公式与 PathwayState.complexity_score 相同（方差按通路顺序逐列累加，结果逐位一致）。
+"""
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+# 复杂度直方图的分箱边界 [0, 0.1, ..., 1.0]
+COMPLEXITY_BINS = np.linspace(0.0, 1.0, 11)
+
+
+def complexity_scores(pathways: np.ndarray) -> np.ndarray:
+    """(n, n_pathways) 通路矩阵 → 每行的信号复杂度（多条通路同时高激活 = 复杂）"""
+    n_pathways = pathways.shape[1]
+    active = np.count_nonzero(pathways > 0.4, axis=1)
+    variance = np.zeros(len(pathways))
+    for j in range(n_pathways):
+        d = pathways[:, j] - 0.5
+        variance += d * d
+    return np.minimum(1.0, active / n_pathways + variance / n_pathways)
+
+
+def partition(scores: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """一次划分：(需要 LLM 的下标, 走规则的下标)，各自保持原顺序"""
+    mask = scores > threshold
+    return np.flatnonzero(mask), np.flatnonzero(~mask)
+
+
+def complexity_histogram(scores: np.ndarray, types: Sequence[str],
+                         threshold: float) -> Dict[str, dict]:
+    """按细胞类型统计复杂度分布：{type: {"counts": [...], "llm": n}}，分箱见 COMPLEXITY_BINS"""
+    types = np.asarray(types, dtype=object)
+    histogram = {}
+    for cell_type in dict.fromkeys(types.tolist()):
+        s = scores[types == cell_type]
+        histogram[cell_type] = {
+            "counts": np.histogram(s, bins=COMPLEXITY_BINS)[0].tolist(),
+            "llm": int(np.count_nonzero(s > threshold)),
+        }
+    return histogram
@@ -14,14 +14,24 @@ import time
 import random
 import logging
 import yaml
+import numpy as np
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # 添加项目根目录到 path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from core.cell import Cell, CellType, CyclePhase
+from core.cell import Cell, CellType, CyclePhase, pathway_values
+from core.combat import resolve_combat
 from core.environment import Environment
+from core.lifecycle import advance_lifecycle, divide
+from core.lineage import Lineage
+from core.motility import TumorLocator, chemotaxis
+from core.population import CELL_TYPES, TYPE_CODE, CellPopulation, RowViews
+from core.rules import apply_rule_decisions
+from core.tombstones import Tombstones
+from core.treatment import Effect, apply_effects, parse_condition
+from core.triage import complexity_histogram, complexity_scores, partition
 from llm.integrator import LLMIntegrator
 
 # v2 知识库（可选）
@@ -51,6 +61,8 @@ class Simulation:
         self.output_dir = Path(sim_cfg.get("output_dir", "output"))
 
         random.seed(self.seed)
+        # population 引擎的向量化随机数
+        self.rng = np.random.default_rng(self.seed)
 
         # v2 知识库（可选）
         self.kb = None
@@ -81,10 +93,24 @@ class Simulation:
             self.llm = None
         self.llm_call_freq = config.get("llm", {}).get("call_frequency", 5)
         self.llm_call_threshold = config.get("llm", {}).get("call_threshold", 0.3)
+        self.triage_stats: Optional[dict] = None  # 最近一次 LLM 分诊的复杂度直方图
+
+        # 细胞存储引擎: objects（Cell 对象列表）/ population（SoA 数组 + CellView）
+        self.engine = sim_cfg.get("engine", "objects")
+        if self.env.ndim == 3 and self.engine != "population":
+            raise ValueError("3D grids require simulation.engine: population")
 
         # 初始化细胞
         self.cells: List[Cell] = []
+        self.lineage = Lineage()  # 顺序整数细胞 ID + 亲代表
+        self.tombstones = Tombstones(self.lineage)  # 死亡细胞档案
+        # 每隔 compact_every 步把死亡细胞移出 self.cells（默认 0 = 不压缩，self.cells 保留死亡细胞，
+        # 与原行为一致）；开启后死亡细胞只在 self.tombstones 中，总数用 len(self.lineage)
+        self.compact_every = sim_cfg.get("compact_every", 0)
         self._init_cells(config["cells"])
+        if self.engine == "population":
+            self.cells = CellPopulation.from_cells(
+                self.cells, self.config.get("perturbations", None), ndim=self.env.ndim)
 
         # 治疗干预
         self.treatment = sim_cfg.get("treatment", None)
@@ -96,9 +122,41 @@ class Simulation:
         # 日志
         self.history = []
         self.save_every = config.get("logging", {}).get("save_every", 5)
-
-        logger.info(f"Simulation initialized: {len(self.cells)} cells, "
-                   f"{self.total_steps} steps, grid {self.env.nx}x{self.env.ny}")
+        # 快照中场的下采样步长（large_tissue 默认把快照场限制在约 200x200）
+        default_stride = 1
+        if self.config["environment"].get("large_tissue"):
+            default_stride = max(1, -(-max(self.env.shape) // 200))
+        self.field_stride = config.get("logging", {}).get("field_stride", default_stride)
+
+        logger.info(f"Simulation initialized: {len(self.cells)} cells ({self.engine}), "
+                   f"{self.total_steps} steps, grid {'x'.join(map(str, self.env.shape))}")
+        self._log_memory_budget()
+
+    def _log_memory_budget(self):
+        """启动时报告场 / 求解器缓冲区 / 细胞列的内存占用"""
+        report = self.env.memory_report()
+        if self.engine == "population":
+            report.update(self.cells.memory_report())
+        totals: Dict[str, int] = {}
+        for key, nbytes in report.items():
+            kind = key.split(":")[0]
+            totals[kind] = totals.get(kind, 0) + nbytes
+        logger.info("Memory budget: " + ", ".join(
+            f"{kind} {nbytes / 2**20:.2f} MiB" for kind, nbytes in totals.items()))
+        for key, nbytes in report.items():
+            logger.info(f"  {key}: {nbytes / 2**10:.1f} KiB")
+
+    def _clamp_positions_population(self, synced_pos: np.ndarray):
+        """位置钳位到网格内，只对相对 synced_pos 有变化的细胞更新空间索引"""
+        pop = self.cells
+        rows = pop.alive_rows()
+        pos = np.clip(pop.position[rows], 0, np.array(self.env.shape) - 1)
+        pop.position[rows] = pos
+        synced = rows < len(synced_pos)
+        changed = np.ones(len(rows), dtype=bool)
+        changed[synced] = (pos[synced] != synced_pos[rows[synced]]).any(axis=1)
+        for cid, xy in zip(pop.id[rows[changed]].tolist(), pos[changed].tolist()):
+            self.env.spatial.move(cid, tuple(xy))
 
     def _adjust_grid_size_for_cell_count(self, config: dict):
         """Bug 3 修复：根据总细胞数动态调整 grid_size，避免高密度肿瘤饿死"""
@@ -124,17 +182,25 @@ class Simulation:
         if total_cells == 0:
             return
         
-        # 目标密度：每个细胞约 4-6 个格子（避免过度拥挤）
-        target_cells_per_grid = 0.2  # 1 cell / 5 grids
+        # 目标密度：每个细胞约 4-6 个格子（避免过度拥挤），可由 target_density 配置
         env_cfg = config.get("environment", {})
+        target_cells_per_grid = env_cfg.get("target_density", 0.2)  # 1 cell / 5 grids
         resolution = env_cfg.get("resolution", 10)
+        large_tissue = env_cfg.get("large_tissue", False)
+        if large_tissue and self.kb and self.kb.tme_params:
+            # KB5 网格分辨率会覆盖配置，按实际分辨率换算物理尺寸
+            resolution = self.kb.get_engine_params().get("grid", {}).get("resolution", resolution)
         
-        # 计算需要的格子数
+        # 计算需要的格子数（3D 网格深度固定，按每层面积换算边长）
         required_grids = total_cells / target_cells_per_grid
+        depth = env_cfg["grid_size"][2:] if len(env_cfg.get("grid_size", [])) > 2 else []
+        if depth:
+            required_grids /= max(1, depth[0] // resolution)
         grid_side = int(required_grids ** 0.5)
         
-        # 最小 20x20，最大 100x100
-        grid_side = max(20, min(100, grid_side))
+        # 最小 20x20，最大 100x100（large_tissue 模式不设上限，可用 max_grid_side 限制）
+        max_side = env_cfg.get("max_grid_side", None if large_tissue else 100)
+        grid_side = max(20, grid_side if max_side is None else min(max_side, grid_side))
         
         # 转换为物理尺寸
         physical_size = grid_side * resolution
@@ -142,7 +208,7 @@ class Simulation:
         # 更新配置
         current_size = env_cfg.get("grid_size", [500, 500])
         if physical_size > current_size[0]:
-            env_cfg["grid_size"] = [physical_size, physical_size]
+            env_cfg["grid_size"] = [physical_size, physical_size] + depth
             logger.info(f"  Grid size adjusted: {current_size} → {physical_size}x{physical_size} "
                        f"for {total_cells} cells (density={target_cells_per_grid:.2f})")
 
@@ -175,7 +241,8 @@ class Simulation:
                             # config 里的值作为 fallback
                             merged = {**initial_state, **sampled}
                             pos = self._spawn_position(spawn)
-                            cell = Cell(cell_type, pos, merged, perturbations)
+                            cell = Cell(cell_type, pos, merged, perturbations,
+                                        lineage=self.lineage)
                             # 去同步化：随机 cycle phase + timer
                             if cell_type == CellType.TUMOR:
                                 t = random.uniform(0, 19)
@@ -197,7 +264,8 @@ class Simulation:
 
                 for _ in range(count):
                     pos = self._spawn_position(spawn)
-                    cell = Cell(cell_type, pos, initial_state.copy(), perturbations)
+                    cell = Cell(cell_type, pos, initial_state.copy(), perturbations,
+                                lineage=self.lineage)
                     if cell_type == CellType.TUMOR:
                         t = random.uniform(0, 19)
                         if t < 8:
@@ -239,7 +307,7 @@ class Simulation:
 
             state = {k: v for k, v in cell_data.items()
                      if k not in ("type", "subtype", "markers")}
-            cell = Cell(cell_type, pos, state, perturbations)
+            cell = Cell(cell_type, pos, state, perturbations, lineage=self.lineage)
             self.cells.append(cell)
 
         from collections import Counter
@@ -248,7 +316,17 @@ class Simulation:
             logger.info(f"  Loaded {n} {t} cells")
 
     def _spawn_position(self, region: str) -> tuple:
-        """根据区域生成位置"""
+        """根据区域生成位置（3D 网格：center 为中心立方体，border 为四个侧面，深度随机）"""
+        x, y = self._spawn_xy(region)
+        if self.env.ndim == 2:
+            return (x, y)
+        nz = self.env.nz
+        if region == "center":
+            rz = nz // 4
+            return (x, y, nz // 2 + random.randint(-rz, rz))
+        return (x, y, random.randint(0, nz-1))
+
+    def _spawn_xy(self, region: str) -> tuple:
         nx, ny = self.env.nx, self.env.ny
         if region == "center":
             cx, cy = nx // 2, ny // 2
@@ -281,6 +359,9 @@ class Simulation:
 
             # 1. 环境更新（扩散+消耗+分泌）
             self.env.step(self.cells)
+            if isinstance(self.cells, CellPopulation):
+                # 空间索引刚按当前位置重建，之后只需同步位置有变化的细胞
+                synced_pos = self.cells.position.copy()
 
             # 2. 治疗干预 — 环境效应（在感知之前修改环境场）
             has_treatment = self.treatment and step >= self.treatment.get('start_step', 1)
@@ -289,10 +370,18 @@ class Simulation:
 
             # 3. 细胞感知环境
             env_snapshot = self.env.build_cell_env_snapshot(self.cells)
-            alive_cells = [c for c in self.cells if c.alive]
-            for cell in alive_cells:
-                cell.sense_environment(env_snapshot)
-                cell.compute_pathways()
+            if isinstance(self.cells, CellPopulation):
+                # CellView 只在逐细胞路径上按需构造
+                alive_cells = RowViews(self.cells, self.cells.alive_rows())
+                # 按细胞类型批量计算通路；local_env 只在 LLM 路径需要时再填充
+                self.cells.compute_pathways(
+                    alive_cells.rows, env_snapshot,
+                    self.env.count_neighbors(self.cells, CellType.TUMOR.value))
+            else:
+                alive_cells = [c for c in self.cells if c.alive]
+                for row, cell in enumerate(alive_cells):
+                    cell.sense_environment(env_snapshot, row)
+                    cell.compute_pathways()
 
             # 3.5 治疗干预 — 通路效应（在 compute_pathways 之后，直接修改通路值）
             if has_treatment:
@@ -303,15 +392,16 @@ class Simulation:
                 for cell in alive_cells:
                     cell.apply_random_decision(step)
             elif self.decision_mode == "rules":
-                for cell in alive_cells:
-                    cell.apply_rule_based_decision(step)
+                self._apply_rules(alive_cells, step)
             elif self.decision_mode == "llm" and step % self.llm_call_freq == 0:
-                # 筛选需要 LLM 的细胞
-                llm_cells = [c for c in alive_cells if c.needs_llm(self.llm_call_threshold)]
-                rule_cells = [c for c in alive_cells if not c.needs_llm(self.llm_call_threshold)]
+                # 筛选需要 LLM 的细胞（复杂度一次算完，一次划分）
+                llm_cells, rule_cells = self._triage(alive_cells, step)
 
                 # LLM 批量决策
                 if llm_cells:
+                    if isinstance(self.cells, CellPopulation):
+                        for cell in llm_cells:
+                            cell.sense_environment(env_snapshot)
                     # v2: 传递当前治疗药物和扰动给 LLM
                     if self.kb and self.llm:
                         self.llm._active_drugs = (
@@ -327,51 +417,37 @@ class Simulation:
                             cell.apply_llm_decision(decisions[cell.id], step)
 
                 # 规则决策
-                for cell in rule_cells:
-                    cell.apply_rule_based_decision(step)
+                self._apply_rules(rule_cells, step)
             else:
                 # 非 LLM 步：全部用规则
-                for cell in alive_cells:
-                    cell.apply_rule_based_decision(step)
+                self._apply_rules(alive_cells, step)
 
-            # 4a-pre. Clamp all cell positions to grid bounds
-            for cell in alive_cells:
-                x, y = cell.position
-                cell.position = (
-                    int(max(0, min(self.env.nx - 1, x))),
-                    int(max(0, min(self.env.ny - 1, y)))
-                )
+            # 4a-pre. Clamp all cell positions to grid bounds（同步空间索引）
+            if isinstance(self.cells, CellPopulation):
+                self._clamp_positions_population(synced_pos)
+            else:
+                for cell in alive_cells:
+                    x, y = cell.position
+                    cell.position = (
+                        int(max(0, min(self.env.nx - 1, x))),
+                        int(max(0, min(self.env.ny - 1, y)))
+                    )
+                    self.env.spatial.move(cell.id, cell.position)
 
             # 4a. 应用分泌物到环境
             self._apply_secretions(alive_cells)
 
             # 4b. Combat resolution — 攻击者杀伤目标
-            self._resolve_combat(alive_cells)
-
-            # 4c. 能量耗尽 → 死亡
-            for cell in alive_cells:
-                if cell.energy <= 0:
-                    cell.alive = False
-
-            # 4d. 生命周期更新
-            new_cells = []
-            alive_cells = [c for c in self.cells if c.alive]  # 刷新
-            for cell in alive_cells:
-                event = cell.update_lifecycle(self.dt)
-                if event == "division":
-                    child = cell.divide()
-                    # 随机延迟避免同步分裂
-                    child.cycle_timer = random.uniform(0, 3)
-                    child.position = (
-                        max(0, min(self.env.nx - 1, child.position[0])),
-                        max(0, min(self.env.ny - 1, child.position[1]))
-                    )
-                    new_cells.append(child)
+            self._resolve_combat(alive_cells, step)
 
-            self.cells.extend(new_cells)
+            if isinstance(self.cells, CellPopulation):
+                self._update_lifecycle_population(step)
+            else:
+                self._update_lifecycle_objects(alive_cells, step)
 
-            # 5. 清理死亡细胞（保留记录但标记）
-            alive_count = sum(1 for c in self.cells if c.alive)
+            # 5. 清理死亡细胞（死亡时已写入墓碑档案，定期压缩出 cells）
+            if self.compact_every and step % self.compact_every == 0:
+                self._compact_cells()
 
             # 6. 记录
             step_time = time.time() - step_start
@@ -388,38 +464,161 @@ class Simulation:
         logger.info(f"Simulation Complete: {total_time:.1f}s")
         if self.llm:
             logger.info(f"LLM Stats: {self.llm.stats()}")
+        for name, cost in self.env.cost_report().items():
+            logger.info(f"  field {name}: {cost['ms_per_step']:.2f} ms/step "
+                        f"({cost['updates']} updates, substeps={cost['substeps']}, "
+                        f"interval={cost['update_interval']})")
         logger.info("=" * 60)
 
         self._save_final_report(total_time)
+        self.env.shutdown()
         if self.llm:
             self.llm.shutdown()
 
+    def _triage(self, alive_cells, step: int):
+        """LLM 分诊：返回 (llm_cells, rule_cells)，并记录各类型的复杂度直方图"""
+        if isinstance(self.cells, CellPopulation):
+            rows = alive_cells.rows
+            scores = complexity_scores(self.cells.pathways[rows])
+            types = np.array([t.value for t in CELL_TYPES], dtype=object)[self.cells.cell_type[rows]]
+        else:
+            pathways = np.array([pathway_values(c.pathways) for c in alive_cells],
+                                dtype=float).reshape(len(alive_cells), -1)
+            scores = complexity_scores(pathways)
+            types = [c.cell_type.value for c in alive_cells]
+        llm_idx, rule_idx = partition(scores, self.llm_call_threshold)
+        self.triage_stats = {
+            "step": step,
+            "threshold": self.llm_call_threshold,
+            "histogram": complexity_histogram(scores, types, self.llm_call_threshold),
+        }
+        if isinstance(self.cells, CellPopulation):
+            return RowViews(self.cells, rows[llm_idx]), RowViews(self.cells, rows[rule_idx])
+        return [alive_cells[i] for i in llm_idx], [alive_cells[i] for i in rule_idx]
+
+    def _apply_rules(self, cells: list, step: int):
+        """规则决策：population 引擎用向量化内核一次算完，objects 引擎逐细胞"""
+        if isinstance(self.cells, CellPopulation):
+            if isinstance(cells, RowViews):
+                rows = cells.rows
+            else:
+                rows = np.fromiter((c.row for c in cells), dtype=np.intp, count=len(cells))
+            apply_rule_decisions(self.cells, rows, self.rng, step)
+        else:
+            for cell in cells:
+                cell.apply_rule_based_decision(step)
+
+    def _bury_cells(self, cells: list, step: int, cause: str):
+        """objects 引擎：把一批刚死亡的细胞写入墓碑档案"""
+        self.tombstones.bury([c.id for c in cells],
+                             [TYPE_CODE[c.cell_type] for c in cells], step, cause)
+
+    def _bury_rows(self, rows: np.ndarray, step: int, cause: str):
+        """population 引擎：把一批刚死亡的行写入墓碑档案"""
+        pop = self.cells
+        self.tombstones.bury(pop.id[rows], pop.cell_type[rows], step, cause)
+
+    def _compact_cells(self):
+        """把死亡细胞移出 self.cells，之后每步的扫描只与存活细胞数成正比"""
+        if isinstance(self.cells, CellPopulation):
+            self.cells.compact()
+        else:
+            self.cells = [c for c in self.cells if c.alive]
+
+    def _update_lifecycle_objects(self, alive_cells: list, step: int):
+        """4c/4d: 能量耗尽死亡 + 逐细胞生命周期与分裂"""
+        # 4c. 能量耗尽 → 死亡
+        starved = []
+        for cell in alive_cells:
+            if cell.energy <= 0:
+                cell.alive = False
+                self.env.spatial.remove(cell.id)
+                starved.append(cell)
+        self._bury_cells(starved, step, "starvation")
+
+        # 4d. 生命周期更新
+        new_cells = []
+        died = []
+        alive_cells = [c for c in self.cells if c.alive]  # 刷新
+        for cell in alive_cells:
+            event = cell.update_lifecycle(self.dt)
+            if event == "death":
+                self.env.spatial.remove(cell.id)
+                died.append(cell)
+            elif event == "division":
+                child = cell.divide(self.lineage)
+                # 随机延迟避免同步分裂
+                child.cycle_timer = random.uniform(0, 3)
+                child.position = (
+                    max(0, min(self.env.nx - 1, child.position[0])),
+                    max(0, min(self.env.ny - 1, child.position[1]))
+                )
+                new_cells.append(child)
+                self.env.spatial.insert(child.id, child.position, child.cell_type.value)
+
+        self._bury_cells(died, step, "apoptosis")
+        self.cells.extend(new_cells)
+
+    def _update_lifecycle_population(self, step: int):
+        """4c/4d: 向量化生命周期，分裂的子细胞一次性追加为新行"""
+        pop = self.cells
+        # 4c. 能量耗尽 → 死亡
+        starved = pop.alive_rows()
+        starved = starved[pop.energy[starved] <= 0]
+        pop.alive[starved] = False
+
+        # 4d. 生命周期更新
+        divided, died, _ = advance_lifecycle(pop, pop.alive_rows(), self.dt)
+        for cid in pop.id[np.concatenate([starved, died])].tolist():
+            self.env.spatial.remove(cid)
+        self._bury_rows(starved, step, "starvation")
+        self._bury_rows(died, step, "apoptosis")
+        children = divide(pop, divided, self.rng, self.env.shape, self.lineage)
+        for cid, pos, code in zip(pop.id[children].tolist(), pop.position[children].tolist(),
+                                  pop.cell_type[children]):
+            self.env.spatial.insert(cid, pos, CELL_TYPES[code].value)
+
     def _apply_secretions(self, alive_cells: list):
         """将细胞分泌物写入环境信号场"""
-        for cell in alive_cells:
-            if not cell.last_decision:
-                continue
-            secretion = cell.last_decision.get("secretion", {})
-            x, y = int(cell.position[0]), int(cell.position[1])
-            for signal_name, amount in secretion.items():
+        # 先收集 (场, x, y, 量)，再按场一次性累加
+        deposits = {}
+        if isinstance(self.cells, CellPopulation):
+            pop = self.cells
+            rows = pop.alive_rows()
+            decided = [(d, pos) for d, pos in zip(pop.last_decision[rows], pop.position[rows].tolist())
+                       if d]
+        else:
+            decided = [(c.last_decision, c.position) for c in alive_cells if c.last_decision]
+        for decision, pos in decided:
+            for signal_name, amount in decision.get("secretion", {}).items():
                 if amount > 0 and signal_name in self.env.fields:
-                    if 0 <= x < self.env.nx and 0 <= y < self.env.ny:
-                        self.env.fields[signal_name][x][y] += amount
+                    deposits.setdefault(signal_name, []).append((amount, *pos))
+        for signal_name, entries in deposits.items():
+            amounts, xs, ys, *zs = zip(*entries)
+            self.env.deposit(signal_name, xs, ys, amounts, *zs)
 
         # 趋化性: migrate 的免疫细胞向最近肿瘤移动
-        tumors = [c for c in alive_cells if c.alive and c.cell_type == CellType.TUMOR]
+        if isinstance(self.cells, CellPopulation):
+            pop = self.cells
+            moved = chemotaxis(pop, pop.alive_rows(), self.env.shape)
+            for cid, pos in zip(pop.id[moved].tolist(), pop.position[moved].tolist()):
+                self.env.spatial.move(cid, pos)
+            return
+        tumors = [c.position for c in alive_cells if c.alive and c.cell_type == CellType.TUMOR]
         if not tumors:
             return
+        locator = None  # 最近肿瘤查询，每步只在有迁移细胞时建一次
         for cell in alive_cells:
             if not cell.alive or not cell.last_decision:
                 continue
             if cell.last_decision.get("action") != "migrate":
                 continue
             if cell.cell_type in (CellType.CD8_T, CellType.NK, CellType.MACROPHAGE):
-                # 找最近的肿瘤
+                # 找最近的肿瘤（并列时取列表中靠前者）
+                if locator is None:
+                    locator = TumorLocator(tumors, self.env.shape)
                 cx, cy = cell.position
-                nearest = min(tumors, key=lambda t: abs(t.position[0]-cx) + abs(t.position[1]-cy))
-                tx, ty = nearest.position
+                tx, ty = locator.nearest(cell.position)
                 # 向肿瘤方向移动 1 步
                 dx = 1 if tx > cx else (-1 if tx < cx else 0)
                 dy = 1 if ty > cy else (-1 if ty < cy else 0)
@@ -427,10 +626,25 @@ class Simulation:
                     max(0, min(self.env.nx - 1, cx + dx)),
                     max(0, min(self.env.ny - 1, cy + dy))
                 )
-
-    def _resolve_combat(self, alive_cells: list):
-        """Combat resolution: 攻击者找附近目标，概率杀伤"""
-        import math
+                self.env.spatial.move(cell.id, cell.position)
+
+    def _resolve_combat(self, alive_cells: list, step: int):
+        """Combat resolution: 攻击者找附近目标，概率杀伤
+
+        population 引擎用 core/combat.py 的栅格结算；objects 引擎保留逐个结算
+        （Python random 流、逐个刷新目标），作为精确参考并与已发表的运行结果逐位一致，
+        大规模模拟应使用 population 引擎。
+        """
+        if isinstance(self.cells, CellPopulation):
+            pop = self.cells
+            n_attackers, killed = resolve_combat(
+                pop, pop.alive_rows(), self.rng, self.env.spatial, self.env.shape)
+            for cid in pop.id[killed].tolist():
+                self.env.spatial.remove(cid)
+            self._bury_rows(killed, step, "killed")
+            if len(killed) > 0:
+                logger.info(f"  Combat: {n_attackers} attackers, {len(killed)} kills")
+            return
 
         # 收集攻击者
         attackers = [c for c in alive_cells if c.alive
@@ -440,38 +654,30 @@ class Simulation:
         if not attackers:
             return
 
-        # 建立空间索引 (简单网格)
-        from collections import defaultdict
-        grid = defaultdict(list)
-        for c in alive_cells:
-            if c.alive:
-                grid[c.position].append(c)
+        # 空间索引由 env.register_cells 每步建立，移动/死亡时已增量同步
+        spatial = self.env.spatial
+        tumors = {c.id: c for c in alive_cells
+                  if c.alive and c.cell_type == CellType.TUMOR}
 
-        kills = 0
+        killed = []
         for attacker in attackers:
-            ax, ay = attacker.position
-            # 搜索附近 (Manhattan distance <= 5)
-            targets = []
-            for dx in range(-5, 6):
-                for dy in range(-5, 6):
-                    pos = (ax + dx, ay + dy)
-                    for candidate in grid.get(pos, []):
-                        if not candidate.alive:
-                            continue
-                        if candidate.id == attacker.id:
-                            continue
-                        # 免疫细胞攻击肿瘤
-                        if (attacker.cell_type in (CellType.CD8_T, CellType.NK, CellType.MACROPHAGE)
-                                and candidate.cell_type == CellType.TUMOR):
-                            targets.append(candidate)
-                        # Treg suppress 不杀，跳过
-                        # Tumor evade 不攻击别人
-
-            if not targets:
+            # 免疫细胞攻击肿瘤；Treg suppress 不杀，Tumor evade 不攻击别人
+            if attacker.cell_type not in (CellType.CD8_T, CellType.NK, CellType.MACROPHAGE):
                 continue
+            ax, ay = attacker.position
+            # 搜索附近 (11x11 窗口)，选 Manhattan 距离最近的目标
+            # 并列时按 (dx, dy, 注册顺序) 取第一个，与逐格扫描一致
+            target, best = None, None
+            for cid in spatial.query(ax, ay, 5):
+                if cid == attacker.id or cid not in tumors:
+                    continue
+                tx, ty = spatial.position(cid)
+                key = (abs(tx - ax) + abs(ty - ay), tx - ax, ty - ay)
+                if best is None or key < best:
+                    target, best = tumors[cid], key
 
-            # 选最近的目标
-            target = min(targets, key=lambda t: abs(t.position[0] - ax) + abs(t.position[1] - ay))
+            if target is None:
+                continue
 
             # 杀伤概率 = base_kill_rate * cytotoxicity * (1 - target.immune_evasion)
             cytotox = getattr(attacker, 'cytotoxicity', getattr(attacker, 'activation', 0.5))
@@ -482,10 +688,12 @@ class Simulation:
 
             if random.random() < kill_prob:
                 target.alive = False
-                kills += 1
+                spatial.remove(target.id)
+                killed.append(target)
 
-        if kills > 0:
-            logger.info(f"  Combat: {len(attackers)} attackers, {kills} kills")
+        self._bury_cells(killed, step, "killed")
+        if killed:
+            logger.info(f"  Combat: {len(attackers)} attackers, {len(killed)} kills")
 
     def _apply_treatment(self, step: int):
         """应用治疗干预 — 优先从 Drug Library 读取，fallback 到硬编码"""
@@ -559,50 +767,26 @@ class Simulation:
         # NOTE: 通路直接修改已移到 _apply_treatment_pathway_effects()
         # 在 compute_pathways() 之后调用，避免被覆盖
 
-        # 细胞效应
-        for cell in self.cells:
-            if not cell.alive:
-                continue
-            ct = cell.cell_type.value
-            effects = drug.get("cell_effects", {}).get(ct)
-            if not effects:
-                continue
-
-            # 癌种特异性修正
-            cancer_mod = drug.get("cancer_specific_modifiers", {}).get(
-                self.kb.cancer_id, {}
-            )
-            efficacy_mult = cancer_mod.get("efficacy_multiplier", 1.0)
-
-            for se in effects.get("state_effects", []):
-                param = se["parameter"]
-                direction = se["direction"]
+        # 细胞效应（按细胞类型批量应用，population 引擎按列）
+        # 癌种特异性修正
+        cancer_mod = drug.get("cancer_specific_modifiers", {}).get(self.kb.cancer_id, {})
+        efficacy_mult = cancer_mod.get("efficacy_multiplier", 1.0)
+        cell_effects = drug.get("cell_effects", {})
+        effects = {}
+        for cell_type in CellType:
+            for se in (cell_effects.get(cell_type.value) or {}).get("state_effects", []):
                 rate = se.get("rate_per_step", 0.05) * strength * efficacy_mult
-
-                # 检查条件
-                condition = se.get("condition", "")
-                if condition:
-                    # 简单条件解析: "exhaustion > 0.1"
-                    try:
-                        current_val = getattr(cell, param, 0)
-                        if ">" in condition:
-                            threshold = float(condition.split(">")[1].strip())
-                            if current_val <= threshold:
-                                continue
-                        elif "<" in condition:
-                            threshold = float(condition.split("<")[1].strip())
-                            if current_val >= threshold:
-                                continue
-                    except (ValueError, AttributeError):
-                        pass
-
-                current = getattr(cell, param, None)
-                if current is not None:
-                    if direction == "increase":
-                        max_val = se.get("max_value", 1.0)
-                        setattr(cell, param, min(max_val, current + rate))
-                    elif direction == "decrease":
-                        setattr(cell, param, max(0, current - rate))
+                # 简单条件: "exhaustion > 0.1"（与被修改参数的当前值比较）
+                where = parse_condition(se.get("condition", ""))
+                if se["direction"] == "increase":
+                    effect = Effect(se["parameter"], "increase", rate,
+                                    cap=se.get("max_value", 1.0), **where)
+                elif se["direction"] == "decrease":
+                    effect = Effect(se["parameter"], "decrease", rate, **where)
+                else:
+                    continue
+                effects.setdefault(cell_type, []).append(effect)
+        apply_effects(self.cells, effects)
 
     def _apply_treatment_pathway_effects(self, step: int):
         """在 compute_pathways() 之后直接修改通路值，让 rules 模式感知到药物效应"""
@@ -630,126 +814,119 @@ class Simulation:
             drug_ids = [drug_map.get(ttype, ttype)]
 
         # 对每个药物，直接修改 CD8_T 通路
+        # 抗体阻断：strength=0.8 → 通路降至 ~4%（几乎完全阻断）
+        block = max(0, (1 - strength) ** 2)
         for drug_id in drug_ids:
             did = drug_id.upper()
             if "PD1" in did or "PEMBROLIZUMAB" in did:
-                for cell in self.cells:
-                    if cell.alive and cell.cell_type == CellType.CD8_T:
-                        # 抗体阻断：strength=0.8 → PD1 降至 ~4%（几乎完全阻断）
-                        cell.pathways.PD1 *= max(0, (1 - strength) ** 2)
+                apply_effects(self.cells, {CellType.CD8_T: [Effect("pathways.PD1", "scale", block)]})
             if "CTLA4" in did or "IPILIMUMAB" in did:
-                for cell in self.cells:
-                    if cell.alive and cell.cell_type == CellType.CD8_T:
-                        cell.pathways.CTLA4 *= max(0, (1 - strength) ** 2)
+                apply_effects(self.cells, {CellType.CD8_T: [Effect("pathways.CTLA4", "scale", block)]})
             if "TGFB" in did or "GALUNISERTIB" in did:
-                for cell in self.cells:
-                    if cell.alive and cell.cell_type == CellType.CD8_T:
-                        cell.pathways.TGFb_SMAD *= max(0, (1 - strength) ** 2)
+                apply_effects(self.cells,
+                              {CellType.CD8_T: [Effect("pathways.TGFb_SMAD", "scale", block)]})
 
     def _apply_treatment_legacy(self, ttype: str, strength: float):
-        """原硬编码治疗逻辑 (fallback)"""
+        """原硬编码治疗逻辑 (fallback)；细胞效应按类型批量应用"""
+        s = strength
+        effects = {}
 
         if ttype == 'anti_PD1':
             # PD-1 阻断：清除 PD-L1 信号 + 降低免疫逃逸 + 直接激活 T 细胞
-            self.env.fields['PD_L1'] *= (1 - strength)
-            for cell in self.cells:
-                if not cell.alive:
-                    continue
-                if cell.cell_type.value == 'Tumor':
-                    cell.immune_evasion *= (1 - strength * 0.5)
-                    # 肿瘤失去免疫逃逸后更容易被杀
-                    cell.energy -= 0.02 * strength
-                elif cell.cell_type.value == 'CD8_T':
-                    # PD-1 阻断直接解除 T 细胞抑制
-                    cell.pathways.PD1 *= (1 - strength)
-                    cell.exhaustion = max(0, cell.exhaustion - 0.05 * strength)
-                    cell.activation = min(1.0, cell.activation + 0.03 * strength)
+            self.env.fields['PD_L1'] *= (1 - s)
+            effects = {
+                # 肿瘤失去免疫逃逸后更容易被杀
+                CellType.TUMOR: [Effect("immune_evasion", "scale", 1 - s * 0.5),
+                                 Effect("energy", "sub", 0.02 * s)],
+                # PD-1 阻断直接解除 T 细胞抑制
+                CellType.CD8_T: [Effect("pathways.PD1", "scale", 1 - s),
+                                 Effect("exhaustion", "decrease", 0.05 * s),
+                                 Effect("activation", "increase", 0.03 * s)],
+            }
 
         elif ttype == 'anti_CTLA4':
             # CTLA-4 阻断：增强 T 细胞共刺激 + 抑制 Treg
-            for cell in self.cells:
-                if not cell.alive:
-                    continue
-                if cell.cell_type.value == 'CD8_T':
-                    cell.pathways.CTLA4 *= (1 - strength)
-                    cell.pathways.CD28 = min(1.0, cell.pathways.CD28 + 0.05 * strength)
-                    cell.activation = min(1.0, cell.activation + 0.04 * strength)
-                    cell.exhaustion = max(0, cell.exhaustion - 0.03 * strength)
-                elif cell.cell_type.value == 'Treg':
-                    cell.suppressive_activity *= (1 - strength * 0.3)
-                    cell.energy -= 0.02 * strength
+            effects = {
+                CellType.CD8_T: [Effect("pathways.CTLA4", "scale", 1 - s),
+                                 Effect("pathways.CD28", "increase", 0.05 * s),
+                                 Effect("activation", "increase", 0.04 * s),
+                                 Effect("exhaustion", "decrease", 0.03 * s)],
+                CellType.TREG: [Effect("suppressive_activity", "scale", 1 - s * 0.3),
+                                Effect("energy", "sub", 0.02 * s)],
+            }
 
         elif ttype == 'anti_TGFb':
             # TGF-β 阻断：降低免疫抑制微环境
-            self.env.fields['TGF_beta'] *= (1 - strength * 0.7)
-            for cell in self.cells:
-                if not cell.alive:
-                    continue
-                if cell.cell_type.value == 'Treg':
-                    cell.suppressive_activity *= (1 - strength * 0.4)
-                    cell.energy -= 0.03 * strength
-                elif cell.cell_type.value == 'Macrophage':
-                    # M2→M1 极化转换
-                    cell.polarization = max(0, cell.polarization - 0.05 * strength)
+            self.env.fields['TGF_beta'] *= (1 - s * 0.7)
+            effects = {
+                CellType.TREG: [Effect("suppressive_activity", "scale", 1 - s * 0.4),
+                                Effect("energy", "sub", 0.03 * s)],
+                # M2→M1 极化转换
+                CellType.MACROPHAGE: [Effect("polarization", "decrease", 0.05 * s)],
+            }
 
         elif ttype == 'combo_PD1_CTLA4':
             # 联合治疗：PD-1 + CTLA-4
-            self.env.fields['PD_L1'] *= (1 - strength)
-            for cell in self.cells:
-                if not cell.alive:
-                    continue
-                if cell.cell_type.value == 'Tumor':
-                    cell.immune_evasion *= (1 - strength * 0.5)
-                    cell.energy -= 0.03 * strength
-                elif cell.cell_type.value == 'CD8_T':
-                    cell.pathways.PD1 *= (1 - strength)
-                    cell.pathways.CTLA4 *= (1 - strength)
-                    cell.activation = min(1.0, cell.activation + 0.06 * strength)
-                    cell.exhaustion = max(0, cell.exhaustion - 0.06 * strength)
-                elif cell.cell_type.value == 'Treg':
-                    cell.suppressive_activity *= (1 - strength * 0.3)
+            self.env.fields['PD_L1'] *= (1 - s)
+            effects = {
+                CellType.TUMOR: [Effect("immune_evasion", "scale", 1 - s * 0.5),
+                                 Effect("energy", "sub", 0.03 * s)],
+                CellType.CD8_T: [Effect("pathways.PD1", "scale", 1 - s),
+                                 Effect("pathways.CTLA4", "scale", 1 - s),
+                                 Effect("activation", "increase", 0.06 * s),
+                                 Effect("exhaustion", "decrease", 0.06 * s)],
+                CellType.TREG: [Effect("suppressive_activity", "scale", 1 - s * 0.3)],
+            }
 
         elif ttype == 'combo_PD1_TGFb':
             # PD-1 + TGF-β 联合
-            self.env.fields['PD_L1'] *= (1 - strength)
-            self.env.fields['TGF_beta'] *= (1 - strength * 0.7)
-            for cell in self.cells:
-                if not cell.alive:
-                    continue
-                if cell.cell_type.value == 'Tumor':
-                    cell.immune_evasion *= (1 - strength * 0.5)
-                    cell.energy -= 0.03 * strength
-                elif cell.cell_type.value == 'CD8_T':
-                    cell.pathways.PD1 *= (1 - strength)
-                    cell.activation = min(1.0, cell.activation + 0.04 * strength)
-                    cell.exhaustion = max(0, cell.exhaustion - 0.05 * strength)
-                elif cell.cell_type.value == 'Treg':
-                    cell.suppressive_activity *= (1 - strength * 0.4)
-                elif cell.cell_type.value == 'Macrophage':
-                    cell.polarization = max(0, cell.polarization - 0.05 * strength)
+            self.env.fields['PD_L1'] *= (1 - s)
+            self.env.fields['TGF_beta'] *= (1 - s * 0.7)
+            effects = {
+                CellType.TUMOR: [Effect("immune_evasion", "scale", 1 - s * 0.5),
+                                 Effect("energy", "sub", 0.03 * s)],
+                CellType.CD8_T: [Effect("pathways.PD1", "scale", 1 - s),
+                                 Effect("activation", "increase", 0.04 * s),
+                                 Effect("exhaustion", "decrease", 0.05 * s)],
+                CellType.TREG: [Effect("suppressive_activity", "scale", 1 - s * 0.4)],
+                CellType.MACROPHAGE: [Effect("polarization", "decrease", 0.05 * s)],
+            }
+
+        apply_effects(self.cells, effects)
+
+    def _alive_count(self) -> int:
+        if isinstance(self.cells, CellPopulation):
+            return self.cells.alive_count()
+        return sum(1 for c in self.cells if c.alive)
 
     def _step_stats(self, step: int, step_time: float) -> dict:
         """收集当前步的统计"""
-        alive = [c for c in self.cells if c.alive]
-        type_counts = {}
-        for c in alive:
-            t = c.cell_type.value
-            type_counts[t] = type_counts.get(t, 0) + 1
-
-        phase_counts = {}
-        for c in alive:
-            p = c.cycle_phase.value
-            phase_counts[p] = phase_counts.get(p, 0) + 1
-
-        return {
+        if isinstance(self.cells, CellPopulation):
+            type_counts = self.cells.type_counts()
+            phase_counts = self.cells.phase_counts()
+        else:
+            type_counts = {}
+            phase_counts = {}
+            for c in self.cells:
+                if not c.alive:
+                    continue
+                t = c.cell_type.value
+                type_counts[t] = type_counts.get(t, 0) + 1
+                p = c.cycle_phase.value
+                phase_counts[p] = phase_counts.get(p, 0) + 1
+
+        stats = {
             "step": step,
             "time": round(step_time, 3),
-            "alive": len(alive),
-            "total": len(self.cells),
+            "alive": sum(type_counts.values()),
+            "total": len(self.lineage),
             "types": type_counts,
             "phases": phase_counts,
             "env": self.env.field_stats(),
         }
+        if self.triage_stats and self.triage_stats["step"] == step:
+            stats["triage"] = self.triage_stats
+        return stats
 
     def _log_step(self, stats: dict):
         """打印步骤摘要"""
@@ -767,7 +944,7 @@ class Simulation:
             "step": step,
             "cells": [c.snapshot() for c in self.cells if c.alive],
             "env_stats": self.env.field_stats(),
-            "env_fields": self.env.field_snapshot(),
+            "env_fields": self.env.field_snapshot(self.field_stride),
         }
         path = self.output_dir / f"snapshot_step{step:04d}.json"
         with open(path, "w") as f:
@@ -778,10 +955,12 @@ class Simulation:
         report = {
             "total_time": round(total_time, 1),
             "total_steps": self.total_steps,
-            "final_cell_count": sum(1 for c in self.cells if c.alive),
-            "total_cells_created": len(self.cells),
+            "final_cell_count": self._alive_count(),
+            "total_cells_created": len(self.lineage),
+            "deaths": self.tombstones.counts(),
             "llm_stats": self.llm.stats() if self.llm else {"mode": self.decision_mode},
             "kb_stats": self.kb.stats() if self.kb else None,
+            "field_costs": self.env.cost_report(),
             "history": self.history,
         }
         path = self.output_dir / "final_report.json"
@@ -789,6 +968,13 @@ class Simulation:
             json.dump(report, f, indent=2, ensure_ascii=False)
         logger.info(f"Report saved to {path}")
 
+        # 克隆谱系：parent[id] 为母细胞 ID（-1 为初始细胞）
+        with open(self.output_dir / "lineage.json", "w") as f:
+            json.dump(self.lineage.to_dict(), f)
+        # 死亡细胞档案（压缩后 cells 中已不含这些细胞）
+        with open(self.output_dir / "tombstones.json", "w") as f:
+            json.dump(self.tombstones.to_dict(), f)
+
         # 简易文本报告
         txt_path = self.output_dir / "summary.txt"
         with open(txt_path, "w") as f:
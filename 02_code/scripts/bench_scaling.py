@@ -0,0 +1,120 @@
+"""
+大组织扩展性基准：网格与细胞数同步放大时的每步耗时与内存
+
+每个网格边长 n 按 target_density 放入 density·n² 个细胞（population 引擎、rules 决策、
+large_tissue 模式、无 KB），推进若干步后报告：
+- init:    Simulation 构造耗时（细胞生成 + 环境初始化）
+- ms/step: 每步平均耗时（不含快照写盘）
+- fields / scratch / cells: memory_report 中场、求解器缓冲区、细胞列的字节数
+- peak RSS: 进程峰值常驻内存（每个规模在独立子进程中运行）
+
+--depth > 0 时为 n × n × depth 的 3D 体素网格，细胞数为 density·n²·depth。
+--threads > 1 时场更新使用线程池（environment.threads）。
+
+用法: python bench_scaling.py [--sides 100 300 1000] [--density 0.2] [--steps 5] [--depth 0]
+                             [--threads 1]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ENGINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../engine")
+sys.path.insert(0, ENGINE_DIR)
+
+# 细胞组成比例（与 TNBC 默认配置相近）
+MIX = {"Tumor": 0.5, "CD8_T": 0.2, "Treg": 0.06, "Macrophage": 0.1, "NK": 0.07, "B_cell": 0.07}
+SPAWN = {"Tumor": "center", "Macrophage": "random", "B_cell": "random"}
+
+
+def make_config(side: int, density: float, steps: int, output_dir: str,
+                depth: int = 0, threads: int = 1) -> dict:
+    n_cells = int(density * side * side * max(1, depth))
+    return {
+        "simulation": {"total_steps": steps, "dt": 1.0, "seed": 42, "engine": "population",
+                       "decision_mode": "rules", "output_dir": output_dir},
+        "environment": {
+            "grid_size": [100, 100] + ([depth * 10] if depth else []), "resolution": 10,
+            "large_tissue": True, "target_density": density, "threads": threads,
+            "oxygen": {"vessel_concentration": 0.08, "diffusion_coeff": 2.0e-5,
+                       "decay_rate": 0.01, "vessel_density": "medium"},
+            "glucose": {"vessel_concentration": 5.0, "diffusion_coeff": 1.0e-5,
+                        "decay_rate": 0.005},
+            "signals": {
+                "IFN_gamma": {"diffusion_coeff": 1.0e-6, "decay_rate": 0.1},
+                "IL2": {"diffusion_coeff": 1.0e-6, "decay_rate": 0.05},
+                "TGF_beta": {"diffusion_coeff": 8.0e-7, "decay_rate": 0.08},
+                "PD_L1": {"diffusion_coeff": 0, "decay_rate": 0.2},
+            },
+        },
+        "cells": {"types": {t: {"count": int(n_cells * f), "spawn_region": SPAWN.get(t, "border")}
+                            for t, f in MIX.items()}},
+        "logging": {"save_every": steps + 1},
+    }
+
+
+def run_case(side: int, density: float, steps: int, depth: int = 0, threads: int = 1) -> dict:
+    """在当前进程中运行一个规模，返回测量结果"""
+    from simulation import Simulation
+    logging.getLogger("cellswarm").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as out:
+        t = time.perf_counter()
+        sim = Simulation(make_config(side, density, steps, out, depth, threads))
+        init = time.perf_counter() - t
+        report = {**sim.env.memory_report(), **sim.cells.memory_report()}
+        sim._save_snapshot = lambda step: None  # 只测计算，不测快照写盘
+        asyncio.run(sim.run())
+    totals = {}
+    for key, nbytes in report.items():
+        kind = key.split(":")[0]
+        totals[kind] = totals.get(kind, 0) + nbytes
+    return {
+        "grid": "x".join(map(str, sim.env.shape)),
+        "cells": len(sim.cells),
+        "init": init,
+        "ms_step": 1e3 * sum(h["time"] for h in sim.history) / len(sim.history),
+        "fields": totals.get("field", 0),
+        "scratch": totals.get("scratch", 0),
+        "columns": totals.get("column", 0),
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sides", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--density", type=float, default=0.2)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--case", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args.density, args.steps, args.depth, args.threads)))
+        return
+
+    mib = 2 ** 20
+    print(f"{'grid':>14} {'cells':>8} {'init s':>7} {'ms/step':>9} "
+          f"{'fields':>8} {'scratch':>8} {'cells':>8} {'peak RSS':>9}  (MiB)")
+    for side in args.sides:
+        out = subprocess.run(
+            [sys.executable, __file__, "--case", str(side),
+             "--density", str(args.density), "--steps", str(args.steps),
+             "--depth", str(args.depth), "--threads", str(args.threads)],
+            capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['grid']:>14} {r['cells']:>8} {r['init']:>7.2f} {r['ms_step']:>9.1f} "
+              f"{r['fields'] / mib:>8.1f} {r['scratch'] / mib:>8.1f} "
+              f"{r['columns'] / mib:>8.1f} {r['peak_rss'] / mib:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()